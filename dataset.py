@@ -5,7 +5,7 @@ from data_processing.feature_extractor import FeatureExtractor
 from utils import prepare_input_features
 import multiprocessing
 import os
-from utils import get_tf_feature, read_audio
+from utils import get_tf_feature, get_tf_record_filename, read_audio
 import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
 
@@ -124,20 +124,23 @@ class Dataset:
 
         return noise_magnitude, clean_magnitude, noise_phase
 
-    def create_tf_record(self, *, prefix, subset_size, parallel=True):
+    def create_tf_record(self, *, prefix, subset_size, parallel=True, compression=None, magnitude_encoding='float32',
+                         phase_encoding='float32'):
+        """compression is None, 'GZIP' or 'ZLIB'; the encodings are listed in utils.MAGNITUDE_ENCODINGS and
+        utils.PHASE_ENCODINGS and are decoded transparently by utils.tf_record_parser"""
         counter = 0
         p = multiprocessing.Pool(multiprocessing.cpu_count())
 
         for i in range(0, len(self.clean_filenames), subset_size):
 
-            tfrecord_filename = './records/' + prefix + '_' + str(counter) + '.tfrecords'
+            tfrecord_filename = get_tf_record_filename(prefix, counter, compression)
 
             if os.path.isfile(tfrecord_filename):
                 print(f"Skipping {tfrecord_filename}")
                 counter += 1
                 continue
 
-            writer = tf.io.TFRecordWriter(tfrecord_filename)
+            writer = tf.io.TFRecordWriter(tfrecord_filename, options=compression or '')
             clean_filenames_sublist = self.clean_filenames[i:i + subset_size]
 
             print(f"Processing files from: {i} to {i + subset_size}")
@@ -162,7 +165,7 @@ class Dataset:
 
                 for x_, y_, p_ in zip(noise_stft_mag_features, clean_stft_magnitude, noise_stft_phase):
                     y_ = np.expand_dims(y_, 2)
-                    example = get_tf_feature(x_, y_, p_)
+                    example = get_tf_feature(x_, y_, p_, magnitude_encoding, phase_encoding)
                     writer.write(example.SerializeToString())
 
             counter += 1
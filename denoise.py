@@ -0,0 +1,168 @@
+import argparse
+import multiprocessing
+import os
+import time
+from functools import partial
+
+import numpy as np
+import soundfile as sf
+import tensorflow as tf
+
+from data_processing.feature_extractor import FeatureExtractor
+from utils import prepare_input_features, read_audio, revert_features_to_audio
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.ogg')
+
+
+def find_audio_files(directory):
+    filenames = []
+    for root, _, files in os.walk(directory):
+        filenames.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(AUDIO_EXTENSIONS))
+    return sorted(filenames)
+
+
+def extract_features(filename, *, sample_rate, window_length, overlap, num_segments):
+    """Reads a file and builds the model inputs the same way Dataset.parallel_audio_processing does
+    output:
+        features (np.array): (frames, num_features, num_segments, 1) context windows
+        phase (np.array): (num_features, frames) noisy phase
+        mean, std (np.array): per frame statistics used to standardize the magnitude
+        duration (float): the length of the audio in seconds"""
+    audio, _ = read_audio(filename, sample_rate)
+    spectrogram = FeatureExtractor(audio, windowLength=window_length, overlap=overlap,
+                                   sample_rate=sample_rate).get_stft_spectrogram()
+    phase = np.angle(spectrogram)
+    magnitude = np.abs(spectrogram)
+
+    # same per frame standardization as the StandardScaler used to build the records
+    mean = magnitude.mean(axis=0)
+    std = magnitude.std(axis=0)
+    std[std == 0] = 1.0
+    magnitude = (magnitude - mean) / std
+
+    features = prepare_input_features(magnitude, numSegments=num_segments, numFeatures=magnitude.shape[0])
+    features = np.expand_dims(np.transpose(features, (2, 0, 1)), axis=3).astype(np.float32)
+    return features, phase, mean, std, len(audio) / sample_rate
+
+
+class BatchDenoiser:
+    """Packs the context windows of many files into fixed-size batches and reassembles each file's output"""
+
+    def __init__(self, model, *, batch_size, window_length, overlap):
+        self.model = model
+        self.batch_size = batch_size
+        self.window_length = window_length
+        self.overlap = overlap
+        self.pending = []  # (file index, features) chunks waiting to fill a batch
+        self.pending_size = 0
+        self.files = {}  # file index -> [phase, mean, std, outputs, frames left]
+
+    def add(self, index, features, phase, mean, std):
+        if len(features) == 0:
+            # too short for a single context window, no batch would ever finish it
+            return [(index, np.zeros(0, dtype=np.float32))]
+        self.files[index] = [phase, mean, std, [], len(features)]
+        self.pending.append((index, features))
+        self.pending_size += len(features)
+
+        finished = []
+        while self.pending_size >= self.batch_size:
+            finished.extend(self._run_batch())
+        return finished
+
+    def flush(self):
+        finished = []
+        while self.pending_size > 0:
+            finished.extend(self._run_batch())
+        return finished
+
+    def _run_batch(self):
+        # take exactly batch_size windows from the front of the pending chunks, splitting the last one if needed
+        owners, chunks, size = [], [], 0
+        while self.pending and size < self.batch_size:
+            index, features = self.pending[0]
+            take = min(len(features), self.batch_size - size)
+            owners.append((index, take))
+            chunks.append(features[:take])
+            size += take
+            if take == len(features):
+                self.pending.pop(0)
+            else:
+                self.pending[0] = (index, features[take:])
+        self.pending_size -= size
+
+        # pad the last batch so the model always sees the same shape
+        batch = np.concatenate(chunks)
+        if size < self.batch_size:
+            batch = np.concatenate([batch, np.zeros((self.batch_size - size,) + batch.shape[1:], batch.dtype)])
+        outputs = np.asarray(self.model.predict_on_batch(batch))[:size]
+
+        finished = []
+        start = 0
+        for index, take in owners:
+            state = self.files[index]
+            state[3].append(outputs[start:start + take])
+            state[4] -= take
+            start += take
+            if state[4] == 0:
+                finished.append((index, self._reassemble(self.files.pop(index))))
+        return finished
+
+    def _reassemble(self, state):
+        phase, mean, std, outputs, _ = state
+        features = np.squeeze(np.concatenate(outputs), axis=(2, 3))
+        features = features * std[:, None] + mean[:, None]
+        return revert_features_to_audio(features, phase, self.window_length, self.overlap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Denoises every recording in a directory with a trained model.")
+    parser.add_argument("input_dir", help="Directory that is searched recursively for recordings.")
+    parser.add_argument("output_dir", help="Directory for the denoised WAVs, mirroring input_dir.")
+    parser.add_argument("--model", required=True, help="Path of the saved Keras model.")
+    parser.add_argument("--batch_size", default=1024, type=int, help="Context windows per inference batch.")
+    parser.add_argument("--workers", default=multiprocessing.cpu_count(), type=int,
+                        help="Processes used to decode and extract features.")
+    parser.add_argument("--sample_rate", default=16000, type=int)
+    parser.add_argument("--window_length", default=256, type=int)
+    parser.add_argument("--num_segments", default=8, type=int)
+    parser.add_argument("--cpu", action='store_true', help="Hide any GPU so the real-time factor is measured on CPU.")
+    args = parser.parse_args()
+
+    if args.cpu:
+        tf.config.set_visible_devices([], 'GPU')
+
+    overlap = round(0.25 * args.window_length)
+    filenames = find_audio_files(args.input_dir)
+    if not filenames:
+        print(f"No recordings found in {args.input_dir}")
+        return
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    denoiser = BatchDenoiser(model, batch_size=args.batch_size, window_length=args.window_length, overlap=overlap)
+    extract = partial(extract_features, sample_rate=args.sample_rate, window_length=args.window_length,
+                      overlap=overlap, num_segments=args.num_segments)
+
+    def write(finished):
+        for index, audio in finished:
+            relative = os.path.relpath(filenames[index], args.input_dir)
+            output = os.path.join(args.output_dir, os.path.splitext(relative)[0] + '.wav')
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            sf.write(output, audio, args.sample_rate)
+            print(f"Denoised {relative}")
+
+    start = time.perf_counter()
+    total_duration = 0.0
+    with multiprocessing.Pool(args.workers) as p:
+        for index, (features, phase, mean, std, duration) in enumerate(p.imap(extract, filenames)):
+            total_duration += duration
+            write(denoiser.add(index, features, phase, mean, std))
+        write(denoiser.flush())
+    elapsed = time.perf_counter() - start
+
+    print(f"Denoised {len(filenames)} files ({round(total_duration, 1)} s of audio) in {round(elapsed, 1)} s, "
+          f"real-time factor {round(elapsed / total_duration, 3)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,8 @@ def find_max_delay(microphone2, microphone3, rate = 44100, speed_of_sound = 3430
     
     # find the largest distance between the microphones or the origin 
     largest_distance = np.max([np.linalg.norm(microphone2), np.linalg.norm(microphone3), np.linalg.norm(microphone2 - microphone3)])
-    max_delay = int(np.floor(rate * largest_distance / speed_of_sound))
+    # the delays are searched in (-max_delay, max_delay), so one more than the longest delay keeps it and a neighbor
+    max_delay = int(np.ceil(rate * largest_distance / speed_of_sound)) + 1
     return max_delay
 
 def sliding_optimize(sound1, sound2, max_delay, window_size=5000):
@@ -74,6 +75,59 @@ def sliding_optimize(sound1, sound2, max_delay, window_size=5000):
     return delay_vals[np.argmin(scores)]
 
 
+def pairwise_delays(sounds, max_delay, window_size = 5000, interpolate = True):
+    """Finds the delays between the first sound and every other one with GCC-PHAT in a single batch of FFTs
+    input:
+        sounds (list): the sounds, the first one is the reference
+        max_delay (int): delays are searched in (-max_delay, max_delay) like sliding_optimize
+        window_size (int): the number of samples at the end of each sound to use
+        interpolate (bool): refine the peak to a fraction of a sample with a parabola through its neighbors
+
+    output:
+        delays (np.array): the delay of each other sound, positive when sound1[n + delay] matches it at n"""
+
+    # Get the last window_size samples and zero pad so the circular correlation doesn't wrap into the lags
+    frames = np.array([sound[-window_size:] for sound in sounds], dtype=float)
+    n = 1 << int(np.ceil(np.log2(frames.shape[1] + max_delay)))
+    spectra = np.fft.rfft(frames, n)
+
+    # Whiten the cross spectra (PHAT) so only the phase, i.e. the delay, is left and level differences don't matter
+    cross = spectra[:1] * np.conj(spectra[1:])
+    correlation = np.fft.irfft(cross / (np.abs(cross) + 1e-12), n)
+
+    # Lags from -max_delay + 1 to max_delay - 1, the negative ones are at the end of the circular correlation
+    lags = np.arange(-max_delay + 1, max_delay)
+    scores = correlation[:, lags]
+    peaks = np.argmax(scores, axis=1)
+    delays = lags[peaks].astype(float)
+
+    # Fit a parabola through the peak and its neighbors for the fractional part
+    if interpolate:
+        rows = np.arange(len(peaks))
+        inner = (peaks > 0) & (peaks < len(lags) - 1)
+        left = scores[rows, np.maximum(peaks - 1, 0)]
+        center = scores[rows, peaks]
+        right = scores[rows, np.minimum(peaks + 1, len(lags) - 1)]
+        curvature = left - 2 * center + right
+        inner &= curvature < 0
+        delays[inner] += 0.5 * (left - right)[inner] / curvature[inner]
+    return delays
+
+
+def gcc_phat(sound1, sound2, max_delay, window_size = 5000, interpolate = True):
+    """Finds the delay between two sounds with GCC-PHAT, a drop-in for sliding_optimize
+    input:
+        sound1 (np.array): the first sound
+        sound2 (np.array): the second sound
+        max_delay (int): delays are searched in (-max_delay, max_delay)
+        window_size (int): the size of the window to use
+        interpolate (bool): return a fractional delay
+
+    output:
+        delay (float): the delay between the two sounds, same sign as sliding_optimize"""
+    return pairwise_delays([sound1, sound2], max_delay, window_size, interpolate)[0]
+
+
 def find_directions(point, c, eps = .01):
     """Finds the two directions that the v-shape can take
     input:
@@ -98,15 +152,16 @@ def find_directions(point, c, eps = .01):
         direction1 = np.array([0, 1])
         direction2 = np.array([0, -1])
 
-    # If the second point is later than the first, then the v-shape is going to hug the first point
+    # If the second point is later than the first, then the v-shape is going to hug the first point, a change longer
+    # than the distance between the points is noise on the line through them, where the v-shape closes
     elif c > 0:
-        slope = np.sqrt((d**2 / c**2) - 1)
+        slope = np.sqrt(max((d**2 / c**2) - 1, 0))
         direction1 = -np.array([1, -slope])
         direction2 = -np.array([1, slope])
 
     # If the second point is earlier than the first, then the v-shape is going to hug the second point
     else:
-        slope = np.sqrt((d**2 / c**2) - 1)
+        slope = np.sqrt(max((d**2 / c**2) - 1, 0))
         direction1 = np.array([1, slope])
         direction2 = np.array([1, -slope])
     
@@ -212,7 +267,7 @@ def triangulate(p1,p2, t1, t2, mind_dist = 3, max_dist = 100, eps = .01):
     else:
         return locations[max_index]
     
-def radar(microphone2, microphone3, sound1, sound2, sound3, min_dist = 3, max_dist = 100, window_size = 5000, rate = 44100, speed_of_sound = 34314, eps = .01):
+def radar(microphone2, microphone3, sound1, sound2, sound3, min_dist = 3, max_dist = 100, window_size = 5000, rate = 44100, speed_of_sound = 34314, eps = .01, method = 'gcc_phat'):
     """Finds the location of the loudest sound using the recordings from the three microphones
     input: 
         microphone2 (np.array): the position of the second microphone
@@ -223,6 +278,7 @@ def radar(microphone2, microphone3, sound1, sound2, sound3, min_dist = 3, max_di
         min_dist (float): the minimum distance between the microphones and the sound source
         max_dist (float): the maximum distance between the microphones and the sound source
         window_size (int): the size of the window to use for the optimization
+        method (str): 'gcc_phat' for the FFT based fractional delays, 'sliding' for sliding_optimize
     
     output:
         location (np.array): the location of the loudest sound source"""
@@ -231,13 +287,19 @@ def radar(microphone2, microphone3, sound1, sound2, sound3, min_dist = 3, max_di
     max_delay = find_max_delay(microphone2, microphone3, rate, speed_of_sound)
 
     # Find the delays between the sounds
-    delay2 = sliding_optimize(sound1, sound2, max_delay, window_size)
-    delay3 = sliding_optimize(sound1, sound3, max_delay, window_size)
+    if method == 'sliding':
+        delay2 = sliding_optimize(sound1, sound2, max_delay, window_size)
+        delay3 = sliding_optimize(sound1, sound3, max_delay, window_size)
+    else:
+        delay2, delay3 = pairwise_delays([sound1, sound2, sound3], max_delay, window_size)
 
     # convert the delay into a distance
     delay2 = delay2 * speed_of_sound / rate
     delay3 = delay3 * speed_of_sound / rate
 
+    # triangulate takes the distances the other microphones are behind the first one, the delays are the reverse
+    delay2, delay3 = -delay2, -delay3
+
     # handle edge cases where values are small
     if delay2 == delay3:
         if delay2 < 0:
@@ -254,4 +316,4 @@ def radar(microphone2, microphone3, sound1, sound2, sound3, min_dist = 3, max_di
 
 ################################# Run Simulations ##################################
 # Note, it may have the delay be negative
-radar()
\ No newline at end of file
+# radar()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from utils import (COMPRESSION_SUFFIXES, MAGNITUDE_ENCODINGS, PHASE_ENCODINGS, get_tf_feature, get_tf_record_dataset,
+                   revert_features_to_audio)
+
+
+def read_examples(filename, num_examples):
+    """Reads consecutive examples of a record file into numpy arrays"""
+    dataset = get_tf_record_dataset([filename]).take(num_examples).batch(num_examples)
+    noise, clean, phase = next(iter(dataset))
+    return noise.numpy(), clean.numpy(), phase.numpy()
+
+
+def write_examples(filename, examples, compression, magnitude_encoding, phase_encoding):
+    with tf.io.TFRecordWriter(filename, options=compression or '') as writer:
+        for x_, y_, p_ in zip(*examples):
+            example = get_tf_feature(x_, y_, p_, magnitude_encoding, phase_encoding)
+            writer.write(example.SerializeToString())
+
+
+def time_decode(filename, repeats):
+    """Best wall time over a few full passes of the parsing pipeline"""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in get_tf_record_dataset([filename]).batch(256):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def snr_db(reference, estimate):
+    noise = np.sum((reference - estimate) ** 2)
+    if noise == 0:
+        return np.inf
+    return 10 * np.log10(np.sum(reference ** 2) / noise)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the size, decode cost and reconstruction error of the "
+                                                 "record encodings on examples from an existing record file.")
+    parser.add_argument("record", help="A record file written by Dataset.create_tf_record")
+    parser.add_argument("--num_examples", default=1000, type=int,
+                        help="Number of consecutive examples (STFT frames) to re-encode.")
+    parser.add_argument("--window_length", default=256, type=int)
+    parser.add_argument("--overlap", default=64, type=int)
+    parser.add_argument("--repeats", default=3, type=int, help="Decode passes, the fastest one is reported.")
+    args = parser.parse_args()
+
+    examples = read_examples(args.record, args.num_examples)
+    num_examples = len(examples[0])
+    reference = revert_features_to_audio(examples[1], examples[2].T, args.window_length, args.overlap)
+
+    print(f"{'compression':<12}{'magnitude':<11}{'phase':<9}{'bytes/example':>15}{'decode us/example':>19}"
+          f"{'magnitude rmse':>16}{'audio snr dB':>14}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for compression, magnitude_encoding, phase_encoding in itertools.product(
+                [None, *COMPRESSION_SUFFIXES], MAGNITUDE_ENCODINGS, PHASE_ENCODINGS):
+            filename = os.path.join(directory, 'report.tfrecords' + COMPRESSION_SUFFIXES.get(compression, ''))
+            write_examples(filename, examples, compression, magnitude_encoding, phase_encoding)
+            size = os.path.getsize(filename) / num_examples
+            decode = time_decode(filename, args.repeats) / num_examples * 1e6
+
+            noise, clean, phase = read_examples(filename, num_examples)
+            rmse = np.sqrt(np.mean((clean - examples[1]) ** 2))
+            audio = revert_features_to_audio(clean, phase.T, args.window_length, args.overlap)
+            os.remove(filename)
+
+            print(f"{compression or 'none':<12}{magnitude_encoding:<11}{phase_encoding:<9}{size:>15.1f}{decode:>19.1f}"
+                  f"{rmse:>16.4f}{snr_db(reference, audio):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
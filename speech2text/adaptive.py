@@ -0,0 +1,78 @@
+import time
+
+from telemetry import Telemetry
+
+# largest first, every step down roughly halves the decode time
+LADDER = ('small', 'base', 'tiny')
+
+
+class AdaptiveModel:
+    """Switches between preloaded whisper models to keep the captions real time.
+
+    After every transcribe call the smoothed decode time is compared to the latency budget. When it runs over, or
+    more than max_backlog chunks are waiting for ASR, the next smaller model takes over. Once the decode time is
+    below `headroom` times the budget with nothing waiting, the next larger one is tried again. Both need `patience`
+    calls in a row, counted from the last switch, so transient load or the first calls of a new model don't make it
+    flap between sizes."""
+
+    def __init__(self, models, budget, backlog=None, max_backlog=1, headroom=0.4, patience=3, smoothing=0.3,
+                 telemetry=None):
+        """
+        models (list): (name, model) pairs, largest first
+        budget (float): seconds a transcribe call may take
+        backlog: callable returning how many chunks are waiting for ASR
+        telemetry (Telemetry): receives the index of the model in use as 'model_level' after every call"""
+        self.models = models
+        self.budget = budget
+        self.backlog = backlog or (lambda: 0)
+        self.max_backlog = max_backlog
+        self.headroom = headroom
+        self.patience = patience
+        self.smoothing = smoothing
+        self.telemetry = telemetry or Telemetry()
+        self.level = 0
+        self._reset()
+
+    @property
+    def name(self):
+        return self.models[self.level][0]
+
+    @property
+    def model(self):
+        return self.models[self.level][1]
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def _reset(self):
+        self.decode_time = None
+        self.over = self.under = 0
+
+    def _switch(self, level):
+        print(f"Switching from {self.name} to {self.models[level][0]}, "
+              f"decode time {round(self.decode_time, 2)} s for a budget of {self.budget} s")
+        self.level = level
+        self._reset()
+
+    def transcribe(self, audio, **options):
+        start = time.perf_counter()
+        result = self.model.transcribe(audio, **options)
+        elapsed = time.perf_counter() - start
+
+        if self.decode_time is None:
+            self.decode_time = elapsed
+        else:
+            self.decode_time += self.smoothing * (elapsed - self.decode_time)
+        backlog = self.backlog()
+
+        overloaded = self.decode_time > self.budget or backlog > self.max_backlog
+        idle = self.decode_time < self.headroom * self.budget and backlog == 0
+        self.over = self.over + 1 if overloaded else 0
+        self.under = self.under + 1 if idle else 0
+        if self.over >= self.patience and self.level < len(self.models) - 1:
+            self._switch(self.level + 1)
+        elif self.under >= self.patience and self.level > 0:
+            self._switch(self.level - 1)
+
+        self.telemetry.record('model_level', self.level)
+        return result
@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import N_SAMPLES, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+
+from cpu_inference import load_cpu_model
+from replay import load_wav
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg')
+
+
+def find_audio_files(path):
+    """Recordings under a directory (recursively), or listed in a manifest with one path per line or JSON lines
+    with an "audio" key, relative paths are taken from the manifest's directory"""
+    if os.path.isdir(path):
+        filenames = []
+        for root, _, files in os.walk(path):
+            filenames.extend(os.path.join(root, f) for f in files if f.lower().endswith(AUDIO_EXTENSIONS))
+        return sorted(filenames)
+
+    filenames = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                filenames.append(json.loads(line)['audio'] if line.startswith('{') else line)
+    return [os.path.join(os.path.dirname(path), filename) for filename in filenames]
+
+
+def cut_points(audio, length=N_SAMPLES, search=5 * SAMPLE_RATE, frame=SAMPLE_RATE // 10):
+    """Where to cut a recording into inputs of at most `length` samples, so words aren't split at the cuts
+    input:
+        audio (np.array): the samples
+        length (int): the most samples per input
+        search (int): every cut is placed in the quietest frame of the last `search` samples of its input
+        frame (int): samples per frame, the cut is in the middle of the frame
+    output:
+        starts (list): the first sample of every input, starting with 0"""
+    starts = [0]
+    while len(audio) - starts[-1] > length:
+        end = starts[-1] + length
+        region = audio[end - search:end]
+        energy = np.mean(region[:len(region) // frame * frame].reshape(-1, frame) ** 2, axis=1)
+        starts.append(end - search + int(np.argmin(energy)) * frame + frame // 2)
+    return starts
+
+
+def load_segments(filename, n_mels=80):
+    """Decodes a recording and cuts it into whisper's 30 s inputs at quiet points, run in the worker processes
+    output:
+        mels (np.array): (segments, n_mels, 3000) log-mel spectrograms, zero padded to 30 s
+        offsets (list): the start of every segment in seconds
+        duration (float): the length of the audio in seconds"""
+    torch.set_num_threads(1)
+    audio = load_wav(filename, SAMPLE_RATE)
+    starts = cut_points(audio)
+    ends = starts[1:] + [len(audio)]
+    mels = [whisper.log_mel_spectrogram(whisper.pad_or_trim(audio[start:end]), n_mels=n_mels).numpy()
+            for start, end in zip(starts, ends)]
+    return np.stack(mels), [start / SAMPLE_RATE for start in starts], len(audio) / SAMPLE_RATE
+
+
+def split_segments(tokens, tokenizer, offset, duration):
+    """Timestamped segments from the tokens of one decoded 30 s input
+    input:
+        tokens (list): the sampled tokens, timestamp tokens mark segment boundaries
+        tokenizer: the whisper tokenizer the model decoded with
+        offset (float): start of the input in the recording, in seconds
+        duration (float): seconds of audio in the input, closes a segment the model left open
+    output:
+        segments (list): {'start', 'end', 'text'} dicts, times in seconds from the start of the recording"""
+    segments = []
+    start, text_tokens = 0.0, []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            seconds = (token - tokenizer.timestamp_begin) * 0.02
+            if text_tokens:
+                segments.append({'start': offset + start, 'end': offset + seconds,
+                                 'text': tokenizer.decode(text_tokens).strip()})
+                text_tokens = []
+            start = seconds
+        else:
+            text_tokens.append(token)
+    if text_tokens:
+        segments.append({'start': offset + start, 'end': offset + duration,
+                         'text': tokenizer.decode(text_tokens).strip()})
+    return [segment for segment in segments if segment['text']]
+
+
+def read_finished(path):
+    """The recordings already in an output file. A last line that an interruption left half written is cut off, so
+    the lines appended after it stay valid JSON"""
+    done = set()
+    with open(path, 'rb+') as f:
+        lines = f.readlines()
+        position = 0
+        for number, line in enumerate(lines):
+            # every line is written with its newline, a last line without one was interrupted
+            if number == len(lines) - 1 and not line.endswith(b'\n'):
+                print(f"Dropping the unfinished last line of {path}")
+                f.truncate(position)
+                break
+            if line.strip():
+                try:
+                    done.add(json.loads(line)['audio'])
+                except (ValueError, KeyError):
+                    raise ValueError(f"Line {number + 1} of {path} is not a transcription")
+            position += len(line)
+    return done
+
+
+class BatchTranscriber:
+    """Decodes 30 s inputs of many recordings in fixed-size batches through one model.
+
+    Every input has the same shape, so inputs are stacked across file boundaries and a batch is only run once it is
+    full, except by flush(). add() and flush() return the (filename, duration, segments) of every recording whose
+    inputs have all been decoded, in the order the recordings were added."""
+
+    def __init__(self, model, batch_size, options):
+        self.model = model
+        self.batch_size = batch_size
+        self.options = options
+        self.tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                       language=options.language, task=options.task)
+        self.pending = []  # (file entry, segment index, mel) not decoded yet
+        self.files = []  # [filename, duration, segments per input, inputs left, input offsets], in order
+
+    def add(self, filename, mels, offsets, duration):
+        entry = [filename, duration, [None] * len(mels), len(mels), offsets]
+        self.files.append(entry)
+        self.pending.extend((entry, index, mel) for index, mel in enumerate(mels))
+        while len(self.pending) >= self.batch_size:
+            self._run_batch(self.pending[:self.batch_size])
+            self.pending = self.pending[self.batch_size:]
+        return self._finished()
+
+    def flush(self):
+        if self.pending:
+            self._run_batch(self.pending)
+            self.pending = []
+        return self._finished()
+
+    def _run_batch(self, batch):
+        mel = torch.from_numpy(np.stack([mel for _, _, mel in batch])).to(self.model.device)
+        results = whisper.decode(self.model, mel, self.options)
+        for (entry, index, _), result in zip(batch, results):
+            offsets = entry[4] + [entry[1]]
+            entry[2][index] = split_segments(result.tokens, self.tokenizer, offsets[index],
+                                             offsets[index + 1] - offsets[index])
+            entry[3] -= 1
+
+    def _finished(self):
+        finished = []
+        while self.files and self.files[0][3] == 0:
+            filename, duration, segments, _, _ = self.files.pop(0)
+            finished.append((filename, duration, [segment for part in segments for segment in part]))
+        return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribes every recording in a directory or manifest with "
+                                                 "timestamps, one JSON line per recording.")
+    parser.add_argument("input", help="Directory searched recursively for recordings, or a manifest file.")
+    parser.add_argument("output", help="JSON lines file, recordings already in it are skipped.")
+    parser.add_argument("--model", default="base", help="Model to use")
+    parser.add_argument("--batch_size", default=8, type=int, help="30 s inputs decoded together.")
+    parser.add_argument("--workers", default=multiprocessing.cpu_count(), type=int,
+                        help="Processes used to decode the audio and compute the log-mel inputs.")
+    parser.add_argument("--language", default=None, help="Language of the recordings, detected per input if unset.")
+    parser.add_argument("--beam_size", default=None, type=int, help="Beam search width, greedy decoding if unset.")
+    parser.add_argument("--cpu", action='store_true',
+                        help="Run the model on CPU with int8 dynamically quantized linear layers.")
+    parser.add_argument("--threads", default=None, type=int, help="Intra-op threads for CPU inference.")
+    args = parser.parse_args()
+
+    # resume: everything already written is skipped
+    done = read_finished(args.output) if os.path.exists(args.output) else set()
+    filenames = [filename for filename in find_audio_files(args.input) if filename not in done]
+    print(f"{len(filenames)} recordings to transcribe, {len(done)} already in {args.output}")
+    if not filenames:
+        return
+
+    model = load_cpu_model(args.model, args.threads) if args.cpu else whisper.load_model(args.model)
+    options = whisper.DecodingOptions(language=args.language, beam_size=args.beam_size, without_timestamps=False,
+                                      fp16=torch.cuda.is_available() and not args.cpu)
+    transcriber = BatchTranscriber(model, args.batch_size, options)
+    load = partial(load_segments, n_mels=model.dims.n_mels)
+
+    start = time.perf_counter()
+    total_duration = 0.0
+    with open(args.output, 'a') as output:
+        def write(finished):
+            nonlocal total_duration
+            for filename, duration, segments in finished:
+                output.write(json.dumps({'audio': filename, 'duration': duration, 'segments': segments,
+                                         'text': ' '.join(segment['text'] for segment in segments)}) + '\n')
+                output.flush()
+                total_duration += duration
+                elapsed = time.perf_counter() - start
+                print(f"Transcribed {filename} ({round(duration, 1)} s), "
+                      f"{round(total_duration / elapsed, 2)} audio hours per hour")
+
+        with multiprocessing.Pool(args.workers) as p:
+            for filename, (mels, offsets, duration) in zip(filenames, p.imap(load, filenames)):
+                write(transcriber.add(filename, mels, offsets, duration))
+            write(transcriber.flush())
+    elapsed = time.perf_counter() - start
+
+    print(f"Transcribed {len(filenames)} files ({round(total_duration / 3600, 2)} h of audio) in "
+          f"{round(elapsed / 3600, 2)} h, {round(total_duration / elapsed, 2)} audio hours per wall-clock hour")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import bisect
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import whisper
+
+from cpu_inference import CPU_MAX_FALLBACKS, BudgetedModel, decode_options, load_cpu_model
+from incremental import IncrementalTranscriber, normalize_word
+from pipeline import LivePipeline, WindowTranscriber
+from process import pcm_to_float32
+from replay import ReplaySource, expand_paths, load_wav
+from telemetry import Telemetry
+
+DEFAULT_AUDIO = ['../data/harvard sentences/*.wav', '../data/archive/*.wav']
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance over the number of reference words, returns (errors, reference words)"""
+    reference = [w for w in map(normalize_word, reference.split()) if w]
+    hypothesis = [w for w in map(normalize_word, hypothesis.split()) if w]
+    distances = np.arange(len(hypothesis) + 1)
+    for i, word in enumerate(reference, 1):
+        previous, distances = distances, np.empty_like(distances)
+        distances[0] = i
+        for j, other in enumerate(hypothesis, 1):
+            distances[j] = min(previous[j] + 1, distances[j - 1] + 1, previous[j - 1] + (word != other))
+    return int(distances[-1]), len(reference)
+
+
+def load_references(filenames, references_path=None):
+    """Reference text per file, from a JSON {basename: text} file or a .txt next to each recording"""
+    references = {}
+    if references_path:
+        with open(references_path) as f:
+            by_name = json.load(f)
+        references = {filename: by_name[os.path.basename(filename)] for filename in filenames
+                      if os.path.basename(filename) in by_name}
+    for filename in filenames:
+        sidecar = os.path.splitext(filename)[0] + '.txt'
+        if filename not in references and os.path.exists(sidecar):
+            with open(sidecar) as f:
+                references[filename] = f.read()
+    return references
+
+
+def run_replay(model, filenames, *, speed, record_timeout, phrase_timeout, window, incremental, transcribe_options):
+    """Replays the files through the live pipeline
+    output:
+        texts (dict): the captions of each file joined, '' for a file without any
+        lines (int): the number of caption lines
+        telemetry (Telemetry): the pipeline's timings"""
+    telemetry = Telemetry()
+    source = ReplaySource(filenames, speed=speed, gap=1.5 * phrase_timeout)
+
+    # a pause inside a file starts another line and a file without speech has none, so the lines are attributed to
+    # files by when their audio was replayed instead of by position
+    file_starts = []
+    source.on_file = lambda filename: file_starts.append(time.perf_counter())
+
+    def make_transcriber(buffer):
+        if incremental:
+            return IncrementalTranscriber(model, buffer, **transcribe_options)
+        return WindowTranscriber(model, buffer, **transcribe_options)
+
+    pipeline = LivePipeline(make_transcriber, sample_rate=source.SAMPLE_RATE, window=window,
+                            chunk_duration=record_timeout, phrase_timeout=phrase_timeout / speed,
+                            on_caption=lambda transcription: None, telemetry=telemetry)
+    pipeline.start()
+    source.listen_in_background(lambda _, audio: pipeline.feed(pcm_to_float32(audio.get_raw_data())),
+                                phrase_time_limit=record_timeout)
+    source.finished.wait()
+    pipeline.stop()
+
+    texts = {filename: [] for filename in filenames}
+    for text, captured_at in zip(pipeline.transcription, pipeline.line_times):
+        if captured_at is not None and text:
+            index = max(bisect.bisect_right(file_starts, captured_at) - 1, 0)
+            texts[filenames[index]].append(text)
+    return {filename: ' '.join(lines) for filename, lines in texts.items()}, len(pipeline.transcription), telemetry
+
+
+def benchmark_model(model, name, filenames, references, args, transcribe_options):
+    start = time.perf_counter()
+    texts, lines, telemetry = run_replay(model, filenames, speed=args.speed, record_timeout=args.record_timeout,
+                                          phrase_timeout=args.phrase_timeout, window=args.window,
+                                          incremental=args.incremental, transcribe_options=transcribe_options)
+    elapsed = time.perf_counter() - start
+
+    errors = words = 0
+    for filename, text in texts.items():
+        if filename in references:
+            file_errors, file_words = word_error_rate(references[filename], text)
+            errors += file_errors
+            words += file_words
+
+    summary = telemetry.summary()
+    latency = summary.get('caption_latency', {})
+    return {
+        'model': name,
+        'latency_p50': latency.get('p50'),
+        'latency_p90': latency.get('p90'),
+        'latency_p99': latency.get('p99'),
+        'asr_rtf': summary.get('rtf', {}).get('mean'),
+        'wall_seconds': elapsed,
+        'wer': errors / words if words else None,
+        'lines': lines,
+    }
+
+
+def format_row(row):
+    def number(value, digits=3):
+        return '-' if value is None else f"{value:.{digits}f}"
+
+    return (f"{row['model']:<20}{number(row['latency_p50']):>9}{number(row['latency_p90']):>9}"
+            f"{number(row['latency_p99']):>9}{number(row['asr_rtf']):>9}{number(row['wer']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays recordings through the live path and reports caption "
+                                                 "latency, real-time factor and word error rate per model size.")
+    parser.add_argument("audio", nargs='*', default=DEFAULT_AUDIO, help="WAV files or glob patterns to replay.")
+    parser.add_argument("--models", nargs='+', default=["tiny", "base", "small"])
+    parser.add_argument("--references", default=None,
+                        help="JSON file mapping recording basenames to reference text, "
+                             "otherwise a .txt next to each recording is used.")
+    parser.add_argument("--speed", default=1.0, type=float, help="Replay pace as a multiple of real time.")
+    parser.add_argument("--record_timeout", default=1, type=float)
+    parser.add_argument("--phrase_timeout", default=2, type=float)
+    parser.add_argument("--window", default=30, type=float,
+                        help="Seconds kept for transcription, long enough for a whole recording by default.")
+    parser.add_argument("--incremental", action='store_true')
+    parser.add_argument("--compare_cpu", action='store_true',
+                        help="Also run every model in the CPU inference mode and report both rows.")
+    parser.add_argument("--threads", default=None, type=int, help="Intra-op threads for the CPU mode.")
+    parser.add_argument("--decode", default="greedy", choices=["greedy", "beam"],
+                        help="Decoding policy of the CPU mode.")
+    parser.add_argument("--max_fallbacks", default=CPU_MAX_FALLBACKS, type=int,
+                        help="Temperature fallbacks in the CPU mode.")
+    parser.add_argument("--budget", default=None, type=float, help="Per-transcription time budget in the CPU mode.")
+    parser.add_argument("--output", default=None, help="Also write the rows as JSON lines to this file.")
+    args = parser.parse_args()
+
+    filenames = expand_paths(args.audio)
+    references = load_references(filenames, args.references)
+    duration = sum(len(load_wav(filename)) for filename in filenames) / 16000
+    print(f"Replaying {len(filenames)} files ({round(duration, 1)} s of audio, {len(references)} with references) "
+          f"at {args.speed}x")
+
+    print(f"{'model':<20}{'lat p50':>9}{'lat p90':>9}{'lat p99':>9}{'rtf':>9}{'wer':>8}")
+    rows = []
+    for name in args.models:
+        model = whisper.load_model(name)
+        row = benchmark_model(model, name, filenames, references, args, {'fp16': torch.cuda.is_available()})
+        rows.append(row)
+        print(format_row(row))
+
+        if args.compare_cpu:
+            del model
+            model = load_cpu_model(name, args.threads)
+            if args.budget:
+                model = BudgetedModel(model, args.budget)
+            options = dict(decode_options(args.decode, args.max_fallbacks), fp16=False)
+            row = benchmark_model(model, f"{name}-int8-{args.decode}", filenames, references, args, options)
+            rows.append(row)
+            print(format_row(row))
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+
+
+if __name__ == "__main__":
+    main()
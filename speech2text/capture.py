@@ -0,0 +1,35 @@
+import sounddevice as sd
+
+
+class MultichannelMicrophone:
+    """Captures several microphones of one input device as float32 frames of shape (samples, channels).
+
+    listen_in_background mirrors Recognizer.listen_in_background, except that the callback receives the frames
+    array instead of sr.AudioData. The array is only valid during the callback, PortAudio reuses it."""
+    SAMPLE_WIDTH = 4
+
+    def __init__(self, device=None, channels=3, sample_rate=16000):
+        self.device = device
+        self.channels = channels
+        self.SAMPLE_RATE = sample_rate
+
+    @staticmethod
+    def list_devices():
+        return [device['name'] for device in sd.query_devices() if device['max_input_channels'] > 0]
+
+    def listen_in_background(self, callback, phrase_time_limit=1.0):
+        def audio_callback(indata, frames, time, status):
+            if status:
+                print(status)
+            callback(self, indata)
+
+        stream = sd.InputStream(device=self.device, channels=self.channels, samplerate=self.SAMPLE_RATE,
+                                dtype='float32', blocksize=int(phrase_time_limit * self.SAMPLE_RATE),
+                                callback=audio_callback)
+        stream.start()
+
+        def stopper(wait_for_stop=True):
+            stream.stop()
+            stream.close()
+
+        return stopper
@@ -1,5 +1,8 @@
 from matplotlib import pyplot as plt
 import numpy as np
+import hashlib
+import os
+import time
 
 ################################# Parameters #################################
 # Sound parameters and calculations
@@ -14,6 +17,7 @@ microphone3 = np.array([-8, -16])
 window_size = 1000
 min_distance = 25  # twice the furthest distance between microphones
 max_distance = 200  # 2 meters
+delay_table_version = 2  # part of the cache key of build_delay_table, raise it when the table's contents change
 
 
 ################################# Functions ##################################
@@ -27,11 +31,24 @@ def find_max_delay(microphone2, microphone3, rate=44100, speed_of_sound=34300):
         
     output:
         max_delay (int): the maximum delay between the two microphones"""
+    return array_max_delay([np.zeros(2), microphone2, microphone3], rate, speed_of_sound)
 
-    # find the largest distance between the microphones or the origin 
-    largest_distance = np.max(
-        [np.linalg.norm(microphone2), np.linalg.norm(microphone3), np.linalg.norm(microphone2 - microphone3)])
-    max_delay = int(np.floor(rate * largest_distance / speed_of_sound))
+
+def array_max_delay(microphones, rate=44100, speed_of_sound=34300):
+    """find_max_delay for any number of microphones
+    input:
+        microphones (np.array): (M, 2) the microphone positions
+        rate (int): the rate of the sound
+        speed_of_sound (float): the speed of sound in cm/s
+
+    output:
+        max_delay (int): the bound of the delays between any two of the microphones"""
+
+    # find the largest distance between any two microphones
+    microphones = np.asarray(microphones, dtype=float)
+    largest_distance = np.max(np.linalg.norm(microphones[:, None] - microphones, axis=-1))
+    # the delays are searched in (-max_delay, max_delay), so one more than the longest delay keeps it and a neighbor
+    max_delay = int(np.ceil(rate * largest_distance / speed_of_sound)) + 1
     return max_delay
 
 
@@ -77,6 +94,86 @@ def sliding_optimize(sound1, sound2, max_delay, window_size=5000):
     return delay_vals[np.argmin(scores)]
 
 
+def fft_length(size):
+    """Finds the smallest length of at least size with only 2, 3 and 5 as factors, which the FFT handles fastest"""
+    n = size
+    while True:
+        rest = n
+        for factor in (2, 3, 5):
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return n
+        n += 1
+
+
+def frame_delays(frames, max_delay, interpolate=True):
+    """Finds the delays between the first sound and every other one with GCC-PHAT, for any number of frames at once
+    input:
+        frames (np.array): (..., sounds, window) windows of the sounds, the first sound is the reference
+        max_delay (int): delays are searched in (-max_delay, max_delay) like sliding_optimize
+        interpolate (bool): refine the peak to a fraction of a sample with a parabola through its neighbors
+
+    output:
+        delays (np.array): (..., sounds - 1) the delay of each other sound, positive when sound1[n + delay] matches
+            it at n
+        peaks (np.array): (..., sounds - 1) the height of each correlation peak, 1 for a perfect match"""
+
+    # Zero pad so the circular correlation doesn't wrap into the lags
+    n = fft_length(frames.shape[-1] + max_delay)
+    spectra = np.fft.rfft(frames, n)
+
+    # Whiten the cross spectra (PHAT) so only the phase, i.e. the delay, is left and level differences don't matter
+    cross = spectra[..., :1, :] * np.conj(spectra[..., 1:, :])
+    correlation = np.fft.irfft(cross / (np.abs(cross) + 1e-12), n)
+
+    # Lags from -max_delay + 1 to max_delay - 1, the negative ones are at the end of the circular correlation
+    lags = np.arange(-max_delay + 1, max_delay)
+    scores = correlation[..., lags]
+    peaks = np.argmax(scores, axis=-1)[..., None]
+    delays = lags[peaks[..., 0]].astype(float)
+    center = np.take_along_axis(scores, peaks, axis=-1)[..., 0]
+
+    # Fit a parabola through the peak and its neighbors for the fractional part
+    if interpolate:
+        left = np.take_along_axis(scores, np.maximum(peaks - 1, 0), axis=-1)[..., 0]
+        right = np.take_along_axis(scores, np.minimum(peaks + 1, len(lags) - 1), axis=-1)[..., 0]
+        curvature = left - 2 * center + right
+        inner = (peaks[..., 0] > 0) & (peaks[..., 0] < len(lags) - 1) & (curvature < 0)
+        delays[inner] += 0.5 * (left - right)[inner] / curvature[inner]
+    return delays, center
+
+
+def pairwise_delays(sounds, max_delay, window_size=5000, interpolate=True):
+    """Finds the delays between the first sound and every other one with GCC-PHAT in a single batch of FFTs
+    input:
+        sounds (list): the sounds, the first one is the reference
+        max_delay (int): delays are searched in (-max_delay, max_delay) like sliding_optimize
+        window_size (int): the number of samples at the end of each sound to use
+        interpolate (bool): refine the peak to a fraction of a sample
+
+    output:
+        delays (np.array): the delay of each other sound, positive when sound1[n + delay] matches it at n"""
+
+    # Get the last window_size samples
+    frames = np.array([sound[-window_size:] for sound in sounds], dtype=float)
+    return frame_delays(frames, max_delay, interpolate)[0]
+
+
+def gcc_phat(sound1, sound2, max_delay, window_size=5000, interpolate=True):
+    """Finds the delay between two sounds with GCC-PHAT, a drop-in for sliding_optimize
+    input:
+        sound1 (np.array): the first sound
+        sound2 (np.array): the second sound
+        max_delay (int): delays are searched in (-max_delay, max_delay)
+        window_size (int): the size of the window to use
+        interpolate (bool): return a fractional delay
+
+    output:
+        delay (float): the delay between the two sounds, same sign as sliding_optimize"""
+    return pairwise_delays([sound1, sound2], max_delay, window_size, interpolate)[0]
+
+
 def find_directions(point, c, eps=.01):
     """Finds the two directions that the v-shape can take
     input:
@@ -101,15 +198,16 @@ def find_directions(point, c, eps=.01):
         direction1 = np.array([0, 1])
         direction2 = np.array([0, -1])
 
-    # If the second point is later than the first, then the v-shape is going to hug the first point
+    # If the second point is later than the first, then the v-shape is going to hug the first point, a change longer
+    # than the distance between the points is noise on the line through them, where the v-shape closes
     elif c > 0:
-        slope = np.sqrt((d ** 2 / c ** 2) - 1)
+        slope = np.sqrt(max((d ** 2 / c ** 2) - 1, 0))
         direction1 = -np.array([1, -slope])
         direction2 = -np.array([1, slope])
 
     # If the second point is earlier than the first, then the v-shape is going to hug the second point
     else:
-        slope = np.sqrt((d ** 2 / c ** 2) - 1)
+        slope = np.sqrt(max((d ** 2 / c ** 2) - 1, 0))
         direction1 = np.array([1, slope])
         direction2 = np.array([1, -slope])
 
@@ -218,7 +316,7 @@ def triangulate(p1, p2, t1, t2, mind_dist=3, max_dist=100, eps=.01):
 
 
 def radar(micro2, micro3, sound1, sound2, sound3, min_dist=3, max_dist=100, size_window=5000, local_rate=44100,
-          sos_local=34314, eps=.01):
+          sos_local=34314, eps=.01, method='gcc_phat', solver='triangulate', table=None):
     """Finds the location of the loudest sound using the recordings from the three microphones
     input: 
         microphone2 (np.array): the 2D position of the second microphone
@@ -229,6 +327,9 @@ def radar(micro2, micro3, sound1, sound2, sound3, min_dist=3, max_dist=100, size
         min_dist (float): the minimum distance between the microphones and the sound source
         max_dist (float): the maximum distance between the microphones and the sound source
         window_size (int): the size of the window to use for the optimization
+        method (str): 'gcc_phat' for the FFT based fractional delays, 'sliding' for sliding_optimize
+        solver (str): 'triangulate' intersects the asymptotes, 'least_squares' fits tdoa_least_squares
+        table (np.array): a build_delay_table table for these parameters, the location is then looked up
     
     output:
         location (np.array): the location of the loudest sound source"""
@@ -237,13 +338,29 @@ def radar(micro2, micro3, sound1, sound2, sound3, min_dist=3, max_dist=100, size
     max_delay = find_max_delay(micro2, micro3, local_rate, sos_local)
 
     # Find the delays between the sounds
-    delay2 = sliding_optimize(sound1, sound2, max_delay, size_window)
-    delay3 = sliding_optimize(sound1, sound3, max_delay, size_window)
+    if method == 'sliding':
+        delay2 = sliding_optimize(sound1, sound2, max_delay, size_window)
+        delay3 = sliding_optimize(sound1, sound3, max_delay, size_window)
+    else:
+        delay2, delay3 = pairwise_delays([sound1, sound2, sound3], max_delay, size_window)
+
+    # the geometry is already solved for every pair of delays
+    if table is not None:
+        check_delay_table(table, max_delay)
+        return lookup_location(table, delay2, delay3)
 
     # convert the delay into a distance
     delay2 = delay2 * sos_local / local_rate
     delay3 = delay3 * sos_local / local_rate
 
+    if solver == 'least_squares':
+        microphones = np.array([[0, 0], micro2, micro3])
+        location = tdoa_least_squares(microphones, [[delay2, delay3]], min_dist, max_dist)[0][0]
+        return None if np.isnan(location).any() else location
+
+    # triangulate takes the distances the other microphones are behind the first one, the delays are the reverse
+    delay2, delay3 = -delay2, -delay3
+
     # handle edge cases where values are small
     if delay2 == delay3:
         if delay2 < 0:
@@ -258,6 +375,578 @@ def radar(micro2, micro3, sound1, sound2, sound3, min_dist=3, max_dist=100, size
     return location
 
 
+################################# Batched ##################################
+def find_directions_frames(point, c, eps=.01):
+    """find_directions for an array of time differences
+    input:
+        point (np.array): the location of the microphone relative to the first one
+        c (np.array): (frames,) the changes in distance between the two microphones
+        eps (float): the tolerance for the vertical line
+
+    output:
+        direction1 (np.array): (frames, 2) the first directions
+        direction2 (np.array): (frames, 2) the second directions"""
+
+    # get the rotation matrix and the distance from the origin like find_directions
+    point = np.array(point)
+    angle = np.arctan2(point[1], point[0])
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    d = np.linalg.norm(point)
+
+    # the v-shape hugs the first point when c > 0 and the second one otherwise, vertical when c is about 0 and
+    # closed on the line through the points when c is at least their distance
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.sqrt(np.maximum((d ** 2 / c ** 2) - 1, 0))
+    side = np.where(c > 0, -1.0, 1.0)
+    direction1 = np.stack([side, slope], axis=-1)
+    direction2 = np.stack([side, -slope], axis=-1)
+    vertical = np.abs(c) / d < eps
+    direction1[vertical] = [0, 1]
+    direction2[vertical] = [0, -1]
+
+    # Rotate the vectors and normalize them
+    direction1 = direction1 @ rot.T
+    direction2 = direction2 @ rot.T
+    direction1 /= np.linalg.norm(direction1, axis=-1, keepdims=True)
+    direction2 /= np.linalg.norm(direction2, axis=-1, keepdims=True)
+    return np.round(direction1, 4), np.round(direction2, 4)
+
+
+def solve_intersect_frames(direction1, direction2, midpoint1, midpoint2, eps=.01):
+    """solve_intersect for arrays of directions, rows without an intersection are the origin like in triangulate
+    output:
+        location (np.array): (frames, 2) the locations of the intersections"""
+
+    # the columns of D are the two directions, invert every 2x2 matrix in closed form
+    det = direction1[:, 0] * direction2[:, 1] - direction2[:, 0] * direction1[:, 1]
+    offset = midpoint2 - midpoint1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaler1 = (direction2[:, 1] * offset[0] - direction2[:, 0] * offset[1]) / det
+        scaler2 = -(direction1[:, 0] * offset[1] - direction1[:, 1] * offset[0]) / det
+    location = (direction1 * scaler1[:, None] + direction2 * scaler2[:, None] + midpoint1 + midpoint2) / 2
+
+    # only positive scalars, opposite directions have no intersection and parallel ones meet at infinity
+    location[~((det >= eps) & (scaler1 > 0) & (scaler2 > 0))] = 0
+    location[np.linalg.norm(direction1 - direction2, axis=1) < eps] = np.inf
+    return location
+
+
+def triangulate_frames(p1, p2, t1, t2, mind_dist=3, max_dist=100, eps=.01):
+    """triangulate for arrays of time differences, all frames in one pass
+    input:
+        p1, p2 (np.array): the positions of the second and third microphone
+        t1, t2 (np.array): (frames,) the time differences between the first and second, and first and third
+        mind_dist, max_dist (float): the distance bounds of triangulate
+        eps (float): the tolerance for the vertical line
+
+    output:
+        locations (np.array): (frames, 2) the locations of the sound source, nan where triangulate returns None"""
+    d11, d12 = find_directions_frames(p1, t1, eps=eps)
+    d21, d22 = find_directions_frames(p2, t2, eps=eps)
+    midpoint1 = p1 / 2
+    midpoint2 = p2 / 2
+
+    # the 4 possible locations in the same order as triangulate, and the furthest one of each frame
+    locations = np.stack([solve_intersect_frames(d11, d22, midpoint1, midpoint2, eps=eps),
+                          solve_intersect_frames(d11, d21, midpoint1, midpoint2, eps=eps),
+                          solve_intersect_frames(d12, d22, midpoint1, midpoint2, eps=eps),
+                          solve_intersect_frames(d12, d21, midpoint1, midpoint2, eps=eps)], axis=1)
+    distances = np.linalg.norm(locations, axis=2)
+    max_index = np.argmax(distances, axis=1)
+    frames = np.arange(len(max_index))
+    result = locations[frames, max_index]
+    furthest = distances[frames, max_index]
+
+    # beyond max_dist, the sum of the two directions scaled by max_dist
+    outer = np.where(((max_index == 0) | (max_index == 3))[:, None], d11 + d22, d12 + d21)
+    outer = outer / np.linalg.norm(outer, axis=1, keepdims=True) * max_dist
+    result = np.where((furthest > max_dist)[:, None], outer, result)
+    result[furthest < mind_dist] = np.nan
+    return result
+
+
+def radar_frames(micro2, micro3, sounds, hop, min_dist=3, max_dist=100, size_window=5000, local_rate=44100,
+                 sos_local=34314, eps=.01, block=256):
+    """Runs radar over every hop of a whole multichannel recording, with the frames processed in batches
+    input:
+        micro2, micro3 (np.array): the 2D positions of the second and third microphone
+        sounds (np.array): (samples, 3) the recordings of the three microphones
+        hop (int): the samples between the ends of consecutive windows
+        min_dist, max_dist, size_window, local_rate, sos_local, eps: like radar
+        block (int): the number of frames per batch of FFTs, bounds the memory
+
+    output:
+        times (np.array): (frames,) the end of each window in seconds, where radar would see it
+        locations (np.array): (frames, 2) the location of the loudest sound, nan where radar returns None
+        confidence (np.array): (frames,) the lower of the two GCC-PHAT peak heights, 1 for a perfect match"""
+
+    # every window as a strided view, (frames, 3, size_window) without copying the recording
+    windows = np.lib.stride_tricks.sliding_window_view(sounds, size_window, axis=0)[::hop]
+    times = (np.arange(len(windows)) * hop + size_window) / local_rate
+    max_delay = find_max_delay(micro2, micro3, local_rate, sos_local)
+
+    delays = np.empty((len(windows), 2))
+    confidence = np.empty(len(windows))
+    for start in range(0, len(windows), block):
+        block_delays, peaks = frame_delays(windows[start:start + block], max_delay)
+        delays[start:start + block] = block_delays
+        confidence[start:start + block] = peaks.min(axis=1)
+
+    # convert the delays into distances and triangulate all frames at once
+    delay2, delay3 = (delays * sos_local / local_rate).T
+    return times, locate_frames(micro2, micro3, delay2, delay3, min_dist, max_dist, eps), confidence
+
+
+def locate_frames(micro2, micro3, delay2, delay3, min_dist=3, max_dist=100, eps=.01):
+    """The location step of radar for arrays of delays converted to distances, including its edge cases
+    output:
+        locations (np.array): (frames, 2) the locations, nan where radar returns None"""
+    # the same sign as in radar, triangulate takes the distances the other microphones are behind the first one
+    delay2, delay3 = -np.asarray(delay2), -np.asarray(delay3)
+    locations = triangulate_frames(micro2, micro3, delay2, delay3, min_dist, max_dist, eps=eps)
+
+    # the edge cases of radar where both delays are the same
+    same = (delay2 == delay3) & (delay2 != 0)
+    locations[same] = np.stack([np.zeros(same.sum()), np.sign(delay2[same]) * max_dist], axis=1)
+    return locations
+
+
+def build_delay_table(micro2, micro3, min_dist=3, max_dist=100, local_rate=44100, sos_local=34314, eps=.01,
+                      cache_dir=None):
+    """Precomputes the location of every pair of integer delays radar can find for a geometry
+    input:
+        micro2, micro3, min_dist, max_dist, local_rate, sos_local, eps: like radar
+        cache_dir (str): directory to keep the table in, it is loaded from there when the parameters match
+
+    output:
+        table (np.array): (lags, lags, 2) the location for delay2 and delay3 from -max_delay + 1 to max_delay - 1,
+            nan where radar returns None"""
+    parameters = repr((delay_table_version, np.round(micro2, 6).tolist(), np.round(micro3, 6).tolist(), min_dist,
+                       max_dist, local_rate, sos_local, eps))
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f"delay_table_{hashlib.sha1(parameters.encode()).hexdigest()[:16]}.npy")
+        if os.path.exists(path):
+            return np.load(path)
+
+    # every combination of the lags sliding_optimize and gcc_phat search
+    max_delay = find_max_delay(micro2, micro3, local_rate, sos_local)
+    lags = np.arange(-max_delay + 1, max_delay) * sos_local / local_rate
+    delay2, delay3 = np.meshgrid(lags, lags, indexing='ij')
+    table = locate_frames(micro2, micro3, delay2.ravel(), delay3.ravel(), min_dist, max_dist, eps)
+    table = table.reshape(len(lags), len(lags), 2)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(path, table)
+    return table
+
+
+def check_delay_table(table, max_delay):
+    """Raises a ValueError when a build_delay_table table doesn't cover the lags of max_delay, lookup_location would
+    clip the delays to its edge and return wrong locations without any sign of it"""
+    if len(table) != 2 * max_delay - 1:
+        raise ValueError(f"The delay table covers {len(table)} lags but the delays span {2 * max_delay - 1}, it was "
+                         f"built for a different geometry or sample rate")
+
+
+def lookup_location(table, delay2, delay3, max_spread=.5):
+    """Reads the location of a pair of delays in samples from a build_delay_table table
+    input:
+        table (np.array): the table for the geometry and rate the delays were found with
+        delay2, delay3 (float): the delays, fractional ones are interpolated between the four nearest entries
+        max_spread (float): the largest distance between the four entries, relative to the furthest of them from the
+            origin, that is interpolated, entries further apart lie on different branches and the nearest is used
+
+    output:
+        location (np.array): the location, None where radar would return None"""
+    max_delay = (len(table) + 1) // 2
+
+    # the position in the table, delays outside the searched lags are clipped to its edge
+    position = np.clip(np.array([delay2, delay3], dtype=float) + max_delay - 1, 0, len(table) - 1)
+    low = np.minimum(np.floor(position).astype(int), len(table) - 2)
+    weight = position - low
+    corners = table[low[0]:low[0] + 2, low[1]:low[1] + 2]
+
+    # bilinear interpolation, or the nearest entry when a corner has no finite location to interpolate with or the
+    # corners jump between branches, where a weighted mean would land between the two
+    points = corners.reshape(-1, 2)
+    spread = np.linalg.norm(points[:, None] - points[None], axis=2).max()
+    if np.isfinite(corners).all() and spread <= max_spread * np.linalg.norm(points, axis=1).max():
+        location = corners[0, 0] * (1 - weight[0]) * (1 - weight[1]) + corners[1, 0] * weight[0] * (1 - weight[1]) \
+                   + corners[0, 1] * (1 - weight[0]) * weight[1] + corners[1, 1] * weight[0] * weight[1]
+    else:
+        location = table[tuple(np.round(position).astype(int))]
+    return None if np.isnan(location).any() else location
+
+
+def tdoa_least_squares(microphones, distances, min_dist=3, max_dist=100, iterations=10, damping=1e-3):
+    """Fits source locations to the delays of any number of microphones, for a batch of frames at once
+    input:
+        microphones (np.array): (M, 2) the microphone positions, the delays are relative to the first one
+        distances (np.array): (frames, M - 1) the delays converted to distances, positive when the sound reaches the
+            other microphone first like the delays of radar
+        min_dist, max_dist (float): the distance bounds of triangulate
+        iterations (int): the number of damped Gauss-Newton steps
+        damping (float): the Levenberg-Marquardt damping relative to the curvature
+
+    output:
+        locations (np.array): (frames, 2) the least squares locations, nan closer than min_dist and pulled in to
+            max_dist further away
+        residual (np.array): (frames,) the root mean square misfit of the distances, small for a consistent fit"""
+    microphones = np.asarray(microphones, dtype=float)
+    distances = np.atleast_2d(distances)
+
+    def misfit(points, measured):
+        # the difference between the range to the first microphone and the others, minus the measured one
+        ranges = np.linalg.norm(points[..., None, :] - microphones, axis=-1)
+        return ranges[..., :1] - ranges[..., 1:] - measured, ranges
+
+    # Start from the best point of a coarse polar grid so the fit doesn't settle on the wrong branch
+    angles = np.linspace(-np.pi, np.pi, 72, endpoint=False)
+    radii = np.geomspace(max(min_dist, 1), max_dist, 6)
+    grid = (radii[:, None, None] * np.stack([np.cos(angles), np.sin(angles)], axis=-1)).reshape(-1, 2)
+    grid_misfit, _ = misfit(grid, distances[:, None, :])
+    points = grid[np.argmin(np.sum(grid_misfit ** 2, axis=-1), axis=1)]
+
+    # Damped Gauss-Newton on all frames at once, every normal equation is a 2x2 system
+    for _ in range(iterations):
+        residuals, ranges = misfit(points, distances)
+        units = (points[:, None, :] - microphones) / np.maximum(ranges, 1e-9)[..., None]
+        jacobian = units[:, :1] - units[:, 1:]
+        normal = np.swapaxes(jacobian, 1, 2) @ jacobian
+        normal += damping * np.trace(normal, axis1=1, axis2=2)[:, None, None] * np.eye(2) + 1e-12 * np.eye(2)
+        gradient = np.swapaxes(jacobian, 1, 2) @ residuals[..., None]
+        points = points - np.linalg.solve(normal, gradient)[..., 0]
+
+    residuals, _ = misfit(points, distances)
+    residual = np.sqrt(np.mean(residuals ** 2, axis=1))
+
+    # the same bounds as triangulate, too far is cut off at max_dist and too close is no location
+    norms = np.linalg.norm(points, axis=1)
+    points = np.where((norms > max_dist)[:, None], points / norms[:, None] * max_dist, points)
+    points[norms < min_dist] = np.nan
+    return points, residual
+
+
+def radar_array(microphones, sounds, hop, min_dist=3, max_dist=100, size_window=5000, local_rate=44100,
+                sos_local=34314, block=256):
+    """radar_frames for any number of microphones, with the locations fitted by tdoa_least_squares
+    input:
+        microphones (np.array): (M, 2) the microphone positions, the first one is the reference
+        sounds (np.array): (samples, M) the recordings in the same order
+        hop, min_dist, max_dist, size_window, local_rate, sos_local, block: like radar_frames
+
+    output:
+        times (np.array): (frames,) the end of each window in seconds
+        locations (np.array): (frames, 2) the location of the loudest sound
+        confidence (np.array): (frames,) the lowest GCC-PHAT peak height
+        residual (np.array): (frames,) the distance misfit of each location in cm"""
+    microphones = np.asarray(microphones, dtype=float)
+    windows = np.lib.stride_tricks.sliding_window_view(sounds, size_window, axis=0)[::hop]
+    times = (np.arange(len(windows)) * hop + size_window) / local_rate
+
+    max_delay = array_max_delay(microphones, local_rate, sos_local)
+
+    locations = np.empty((len(windows), 2))
+    confidence = np.empty(len(windows))
+    residual = np.empty(len(windows))
+    for start in range(0, len(windows), block):
+        delays, peaks = frame_delays(windows[start:start + block], max_delay)
+        confidence[start:start + block] = peaks.min(axis=1)
+        locations[start:start + block], residual[start:start + block] = tdoa_least_squares(
+            microphones, delays * sos_local / local_rate, min_dist, max_dist)
+    return times, locations, confidence, residual
+
+
+def srp_grid(microphones, min_dist=3, max_dist=100, local_rate=44100, sos_local=34314, angles=72, radii=6):
+    """Precomputes the candidate positions of srp_phat and their steering delays
+    input:
+        microphones (np.array): (M, 2) the microphone positions
+        min_dist, max_dist (float): the distance bounds of the candidate positions
+        local_rate (int): the sample rate of the recordings
+        sos_local (float): the speed of sound in cm/s
+        angles (int): directions around the array, every 360 / angles degrees
+        radii (int): distances from min_dist to max_dist, spaced geometrically since far positions differ less
+
+    output:
+        grid (dict): 'points' (radii, angles, 2) the positions, 'pairs' (P, 2) every pair of microphones and
+            'delays' (radii, angles, P) the delay in samples of each pair for each position"""
+    microphones = np.asarray(microphones, dtype=float)
+    directions = np.linspace(-np.pi, np.pi, angles, endpoint=False)
+    distances = np.geomspace(max(min_dist, 1), max_dist, radii)
+    points = distances[:, None, None] * np.stack([np.cos(directions), np.sin(directions)], axis=-1)
+
+    # a positive delay means the first microphone of the pair hears the sound later, like frame_delays
+    pairs = np.array([(i, j) for i in range(len(microphones)) for j in range(i + 1, len(microphones))])
+    ranges = np.linalg.norm(points[..., None, :] - microphones, axis=-1)
+    delays = (ranges[..., pairs[:, 0]] - ranges[..., pairs[:, 1]]) * local_rate / sos_local
+    return {'points': points, 'pairs': pairs, 'delays': delays}
+
+
+def srp_power(frames, grid):
+    """Steered response power with PHAT weighting of every grid position, for any number of frames at once
+    input:
+        frames (np.array): (..., M, window) windows of the microphones in the order of the grid
+        grid (dict): a srp_grid grid
+
+    output:
+        power (np.array): (..., radii, angles) the mean GCC-PHAT correlation of all pairs at the steering delays,
+            1 where every pair agrees perfectly"""
+
+    # one whitened correlation per pair, read at the fractional steering delays instead of steering every
+    # frequency, which costs radii * angles * pairs instead of radii * angles * pairs * frequencies
+    pairs = grid['pairs']
+    n = fft_length(frames.shape[-1] + int(np.ceil(np.abs(grid['delays']).max())) + 1)
+    spectra = np.fft.rfft(frames, n)
+    cross = spectra[..., pairs[:, 0], :] * np.conj(spectra[..., pairs[:, 1], :])
+    correlation = np.fft.irfft(cross / (np.abs(cross) + 1e-12), n)
+
+    # linear interpolation between the two nearest lags, negative lags are at the end of the circular correlation
+    low = np.floor(grid['delays']).astype(int)
+    weight = grid['delays'] - low
+    pair_index = np.arange(len(pairs))
+    power = correlation[..., pair_index, low % n] * (1 - weight) + correlation[..., pair_index, (low + 1) % n] * weight
+    return power.mean(axis=-1)
+
+
+def srp_peaks(power, grid, k=2, min_separation=3):
+    """Finds the strongest directions in the steered response power of one frame
+    input:
+        power (np.array): (radii, angles) the power of srp_power
+        grid (dict): the srp_grid grid
+        k (int): the most sources to return
+        min_separation (int): directions closer than this many grid angles count as the same source
+
+    output:
+        locations (np.array): (sources, 2) the best position in each of the strongest directions, strongest first
+        powers (np.array): (sources,) their power"""
+
+    # the range of a source is much less certain than its direction, so the peaks are picked over the directions
+    best_radius = np.argmax(power, axis=0)
+    direction_power = power[best_radius, np.arange(power.shape[1])]
+
+    locations, powers = [], []
+    available = np.ones(len(direction_power), dtype=bool)
+    for angle in np.argsort(direction_power)[::-1]:
+        if len(locations) == k:
+            break
+        if not available[angle]:
+            continue
+        locations.append(grid['points'][best_radius[angle], angle])
+        powers.append(direction_power[angle])
+
+        # suppress the neighboring directions, around the circle
+        offsets = np.arange(-min_separation + 1, min_separation)
+        available[(angle + offsets) % len(available)] = False
+    return np.array(locations).reshape(-1, 2), np.array(powers)
+
+
+def radar_sources(micro2, micro3, sound1, sound2, sound3, k=2, min_dist=3, max_dist=100, size_window=5000,
+                  local_rate=44100, sos_local=34314, grid=None):
+    """Finds the locations of the k loudest sounds with SRP-PHAT, the multi-source counterpart of radar
+    input:
+        micro2, micro3, sound1, sound2, sound3, min_dist, max_dist, size_window, local_rate, sos_local: like radar
+        k (int): the most sources to return
+        grid (dict): a srp_grid grid for [[0, 0], micro2, micro3], built on every call when not given
+
+    output:
+        locations (np.array): (sources, 2) the sources, strongest first
+        powers (np.array): (sources,) their steered response power, around 1 for a clear source and 0 for noise"""
+    if grid is None:
+        grid = srp_grid(np.array([[0, 0], micro2, micro3]), min_dist, max_dist, local_rate, sos_local)
+    frames = np.array([sound1[-size_window:], sound2[-size_window:], sound3[-size_window:]], dtype=float)
+    return srp_peaks(srp_power(frames, grid), grid, k)
+
+
+################################# Tracking ##################################
+def narrow_delays(frames, centers, width, max_delay, interpolate=True):
+    """Finds the delays between the first sound and every other one, only searching a few lags around a guess
+    input:
+        frames (np.array): (sounds, window) windows of the sounds, the first sound is the reference
+        centers (np.array): (sounds - 1,) the expected delay of each other sound
+        width (int): lags from round(center) - width to round(center) + width are searched
+        max_delay (int): the lags are kept inside (-max_delay, max_delay) like frame_delays
+        interpolate (bool): refine the peak to a fraction of a sample with a parabola through its neighbors
+
+    output:
+        delays (np.array): (sounds - 1,) the delays, same sign as frame_delays
+        peaks (np.array): (sounds - 1,) the normalized correlation at each peak, 1 for a perfect match and 0 when
+            the peak is on the edge of the searched lags, where the true delay is probably outside of them"""
+
+    # a direct correlation at a handful of lags costs lags * window instead of the FFTs of the whole window, the
+    # middle of the other sounds is compared with the reference shifted by each lag
+    frames = np.asarray(frames, dtype=float)
+    size = frames.shape[1] - 2 * max_delay
+    energy = np.concatenate(([0], np.cumsum(frames[0] ** 2)))
+    lowest = -max_delay + 1
+    highest = max(max_delay - 1 - 2 * width, lowest)
+
+    delays = np.empty(len(frames) - 1)
+    peaks = np.empty(len(frames) - 1)
+    for i, center in enumerate(centers):
+        sound = frames[i + 1, max_delay:max_delay + size]
+        first = min(max(int(np.round(center)) - width, lowest), highest)
+        lags = np.arange(first, min(first + 2 * width, max_delay - 1) + 1)
+        starts = max_delay + lags
+        reference = frames[0, starts[0]:starts[-1] + size]
+        norms = np.sqrt((energy[starts + size] - energy[starts]) * np.dot(sound, sound)) + 1e-12
+        scores = np.correlate(reference, sound, 'valid') / norms
+        peak = np.argmax(scores)
+        delays[i] = lags[peak]
+        peaks[i] = scores[peak]
+
+        # Fit a parabola through the peak and its neighbors, a peak on the edge only says the delay is further out
+        if (peak == 0 and lags[0] > lowest) or (peak == len(lags) - 1 and lags[-1] < max_delay - 1):
+            peaks[i] = 0
+        elif interpolate and 0 < peak < len(lags) - 1:
+            curvature = scores[peak - 1] - 2 * scores[peak] + scores[peak + 1]
+            if curvature < 0:
+                delays[i] += 0.5 * (scores[peak - 1] - scores[peak + 1]) / curvature
+    return delays, peaks
+
+
+class RadarTracker:
+    """Follows the loudest sound over consecutive radar windows.
+
+    The location is smoothed by a constant velocity Kalman filter. Its prediction gives the delays to expect, so
+    only width lags around them are searched with narrow_delays. When that peak is weaker than min_confidence, or
+    on the edge of the searched lags, the full GCC-PHAT search of radar runs instead. A full search result far from
+    the prediction starts the track over, and after `patience` windows without any location the track is dropped
+    until the next full search finds one."""
+
+    def __init__(self, micro2, micro3, min_dist=3, max_dist=100, size_window=5000, local_rate=44100,
+                 sos_local=34314, eps=.01, width=3, min_confidence=.5, process_noise=2000., measurement_noise=10.,
+                 gate=13.8, patience=8, solver='triangulate', table=None):
+        """
+        micro2, micro3, min_dist, max_dist, size_window, local_rate, sos_local, eps, solver, table: like radar
+        width (int): lags searched on either side of each predicted delay
+        min_confidence (float): the lowest normalized correlation of the narrow search that is trusted
+        process_noise (float): the spread of the acceleration of the source, in cm / s^2
+        measurement_noise (float): the spread of a single radar location, in cm
+        gate (float): the squared Mahalanobis distance beyond which a full search result starts a new track
+        patience (int): windows without a location before the track is dropped"""
+        self.micro2 = np.asarray(micro2, dtype=float)
+        self.micro3 = np.asarray(micro3, dtype=float)
+        self.microphones = np.array([[0, 0], self.micro2, self.micro3])
+        self.min_dist = min_dist
+        self.max_dist = max_dist
+        self.size_window = size_window
+        self.local_rate = local_rate
+        self.sos_local = sos_local
+        self.eps = eps
+        self.width = width
+        self.min_confidence = min_confidence
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.gate = gate
+        self.patience = patience
+        self.solver = solver
+        self.table = table
+        self.max_delay = find_max_delay(self.micro2, self.micro3, local_rate, sos_local)
+        if table is not None:
+            check_delay_table(table, self.max_delay)
+        self.reset()
+
+    def reset(self):
+        """Forgets the track, the next window is searched in full"""
+        self.state = None  # x, y, vx, vy in cm and cm / s
+        self.covariance = None
+        self.misses = 0
+        self.last_time = None
+        self.confidence = 0.0
+        self.full_search = True
+
+    def predicted_delays(self, location):
+        """The delays frame_delays finds for a source at location, in samples"""
+        ranges = np.linalg.norm(location - self.microphones, axis=1)
+        return (ranges[0] - ranges[1:]) * self.local_rate / self.sos_local
+
+    def _locate(self, delays):
+        # the location step of radar
+        if self.table is not None:
+            return lookup_location(self.table, *delays)
+        distances = delays * self.sos_local / self.local_rate
+        if self.solver == 'least_squares':
+            location = tdoa_least_squares(self.microphones, [distances], self.min_dist, self.max_dist)[0][0]
+        else:
+            location = locate_frames(self.micro2, self.micro3, distances[:1], distances[1:], self.min_dist,
+                                     self.max_dist, self.eps)[0]
+        return None if np.isnan(location).any() or np.isinf(location).any() else location
+
+    def _predict(self, dt):
+        transition = np.eye(4)
+        transition[:2, 2:] = dt * np.eye(2)
+
+        # white noise acceleration over dt
+        noise = np.zeros((4, 4))
+        noise[:2, :2] = dt ** 3 / 3 * np.eye(2)
+        noise[:2, 2:] = noise[2:, :2] = dt ** 2 / 2 * np.eye(2)
+        noise[2:, 2:] = dt * np.eye(2)
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + self.process_noise ** 2 * noise
+
+    def _start(self, location):
+        self.state = np.array([location[0], location[1], 0., 0.])
+        self.covariance = np.diag([self.measurement_noise ** 2] * 2 + [(self.max_dist / 2) ** 2] * 2)
+
+    def _correct(self, location):
+        """Kalman update with a location, returns the squared Mahalanobis distance of the innovation"""
+        innovation = location - self.state[:2]
+        spread = self.covariance[:2, :2] + self.measurement_noise ** 2 * np.eye(2)
+        distance = innovation @ np.linalg.solve(spread, innovation)
+        gain = np.linalg.solve(spread, self.covariance[:2]).T
+        self.state = self.state + gain @ innovation
+        self.covariance = self.covariance - gain @ self.covariance[:2]
+        return distance
+
+    def update(self, sound1, sound2, sound3, dt=None):
+        """Tracks the sound in the newest window of the recordings
+        input:
+            sound1, sound2, sound3 (np.array): the recordings, at least size_window + 2 * max_delay long so the
+                narrow search has the same window as the full one
+            dt (float): seconds since the previous window, measured with the clock when not given
+
+        output:
+            location (np.array): the smoothed location, None when there is no track"""
+        now = time.monotonic()
+        if dt is None:
+            dt = now - self.last_time if self.last_time is not None else 0.0
+        self.last_time = now
+        if self.state is not None:
+            self._predict(dt)
+
+        length = self.size_window + 2 * self.max_delay
+        frames = np.array([sound1[-length:], sound2[-length:], sound3[-length:]], dtype=float)
+
+        # look around the predicted delays first, and everywhere when the sound isn't there
+        location = None
+        self.full_search = self.state is None or 2 * self.width + 1 >= 2 * self.max_delay - 1
+        if not self.full_search:
+            delays, peaks = narrow_delays(frames, self.predicted_delays(self.state[:2]), self.width, self.max_delay)
+            self.confidence = peaks.min()
+            if self.confidence >= self.min_confidence:
+                location = self._locate(delays)
+            self.full_search = location is None
+        if self.full_search:
+            delays, peaks = frame_delays(frames[:, -self.size_window:], self.max_delay)
+            self.confidence = peaks.min()
+            location = self._locate(delays)
+
+        if location is None:
+            self.misses += 1
+            if self.misses >= self.patience:
+                self.reset()
+            return None if self.state is None else self.state[:2].copy()
+
+        self.misses = 0
+        if self.state is None:
+            self._start(location)
+        elif self._correct(location) > self.gate and self.full_search:
+            # a different source, or the same one after a jump the narrow search could not follow
+            self._start(location)
+        return self.state[:2].copy()
+
+
 ################################# Run Simulations ##################################
 # Note, it may have the delay be negative
 # radar()
@@ -0,0 +1,107 @@
+import platform
+import time
+
+import torch
+import whisper
+from torch import nn
+
+# whisper's own fallback ladder, every entry is one more full decoding pass of a difficult chunk
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+# the fallbacks the CPU mode allows by default, all six passes of a difficult chunk are the latency spikes it avoids
+CPU_MAX_FALLBACKS = 1
+
+
+def load_cpu_model(name, threads=None, quantize=True):
+    """Loads a whisper model for CPU inference
+    input:
+        name (str): the whisper model name
+        threads (int): intra-op threads for torch, None keeps torch's default of one per core
+        quantize (bool): dynamically quantize the linear layers (attention projections and MLPs) to int8
+    output:
+        model: the whisper model, quantized weights are dequantized on the fly per matmul"""
+    if threads:
+        torch.set_num_threads(threads)
+    model = whisper.load_model(name, device='cpu')
+    if not quantize:
+        return model
+
+    # the glasses' ARM cores only have the qnnpack kernels
+    if platform.machine().lower() in ('aarch64', 'arm64'):
+        torch.backends.quantized.engine = 'qnnpack'
+
+    # whisper's Linear subclass only casts weights to the input dtype, which is a no-op in float32, and
+    # quantize_dynamic only swaps exact nn.Linear modules
+    for module in model.modules():
+        if isinstance(module, nn.Linear):
+            module.__class__ = nn.Linear
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def decode_options(policy='greedy', max_fallbacks=None):
+    """transcribe() keyword arguments for a decode policy
+    input:
+        policy (str): 'greedy' is model.transcribe's own default, 'beam' uses a beam of 2 at temperature 0 and the best
+            of 2 samples above it
+        max_fallbacks (int): how many higher temperature retries a chunk may get, None keeps all of them, this is what
+            bounds the time of a difficult chunk
+    output:
+        options (dict): keyword arguments for model.transcribe"""
+    options = {}
+    if policy == 'beam':
+        options.update(beam_size=2, best_of=2)
+    elif policy != 'greedy':
+        raise ValueError(f"Unknown decode policy: {policy}")
+    if max_fallbacks is not None:
+        options['temperature'] = TEMPERATURES[:max_fallbacks + 1]
+    return options
+
+
+def first_pass_options(options):
+    """The whisper.DecodingOptions arguments of transcribe's first pass, for a single whisper.decode call
+    input:
+        options (dict): keyword arguments for model.transcribe, like decode_options returns
+    output:
+        options (dict): the same with one temperature, decode only takes beam_size at temperature 0 and best_of
+            above it, transcribe drops the other one the same way"""
+    options = dict(options)
+    temperature = options.pop('temperature', 0.0)
+    if not isinstance(temperature, (int, float)):
+        temperature = temperature[0]
+    options.pop('best_of' if temperature == 0 else 'beam_size', None)
+    return dict(options, temperature=temperature)
+
+
+class BudgetedModel:
+    """Wraps a whisper model so one transcribe call stays within a time budget.
+
+    Each temperature fallback is another full decoding pass, so the wrapper keeps a running estimate of the time per
+    pass and only offers as many temperatures as fit in `budget` seconds. A chunk always gets its first, greedy or
+    beam, pass."""
+
+    def __init__(self, model, budget, smoothing=0.3):
+        self.model = model
+        self.budget = budget
+        self.smoothing = smoothing
+        self.pass_time = None
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def transcribe(self, audio, temperature=TEMPERATURES, **options):
+        temperatures = (temperature,) if isinstance(temperature, (int, float)) else tuple(temperature)
+        if self.pass_time:
+            temperatures = temperatures[:max(1, int(self.budget / self.pass_time))]
+
+        start = time.perf_counter()
+        result = self.model.transcribe(audio, temperature=temperatures, **options)
+        elapsed = time.perf_counter() - start
+
+        # the temperature each segment was accepted at tells how many passes were run
+        passes = 1 + max([temperatures.index(segment['temperature']) for segment in result['segments']
+                          if segment['temperature'] in temperatures] or [0])
+        pass_time = elapsed / passes
+        if self.pass_time is None:
+            self.pass_time = pass_time
+        else:
+            self.pass_time += self.smoothing * (pass_time - self.pass_time)
+        return result
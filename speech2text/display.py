@@ -1,5 +1,8 @@
 import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
+import queue
+import time
 import wave
 
 from pydub import AudioSegment
@@ -89,4 +92,108 @@ def play_audio(wav_data):
     audio_segment = AudioSegment.from_file(wav_data, format="wav")
     print("Playing audio...")
     play(audio_segment)
-    print("Audio finished")
\ No newline at end of file
+    print("Audio finished")
+
+
+class LiveVisualizer:
+    """Scrolling waveform envelope and spectrogram of a live stream, drawn by a separate process.
+
+    push() never blocks the caller: chunks go through a small queue and are dropped when the plot can't keep up.
+    The plot process decimates each new column of samples to its min/max envelope and one FFT, so its cost scales
+    with the new audio rather than the window, and redraws with blitting at most `fps` times per second."""
+
+    def __init__(self, sample_rate=16000, seconds=5, columns=500, n_fft=256, fps=15):
+        self.settings = dict(sample_rate=sample_rate, seconds=seconds, columns=columns, n_fft=n_fft, fps=fps)
+        context = multiprocessing.get_context('spawn')
+        self.queue = context.Queue(maxsize=64)
+        self.process = context.Process(target=_run_visualizer, args=(self.queue,), kwargs=self.settings,
+                                       daemon=True)
+
+    def start(self):
+        self.process.start()
+
+    def push(self, samples):
+        try:
+            self.queue.put_nowait(np.asarray(samples, dtype=np.float32))
+        except queue.Full:
+            pass
+
+    def stop(self):
+        try:
+            self.queue.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+def _run_visualizer(chunks, sample_rate, seconds, columns, n_fft, fps):
+    column_length = max(int(seconds * sample_rate / columns), 1)
+    fft_length = min(n_fft, column_length)
+    window = np.hanning(fft_length)
+    lower = np.zeros(columns)
+    upper = np.zeros(columns)
+    spectrogram = np.full((fft_length // 2 + 1, columns), -100.0)
+
+    fig, (ax_wave, ax_spec) = plt.subplots(2, 1, figsize=(10, 6), sharex=True)
+    x = np.linspace(-seconds, 0, columns)
+    upper_line, = ax_wave.plot(x, upper, color='tab:blue', animated=True)
+    lower_line, = ax_wave.plot(x, lower, color='tab:blue', animated=True)
+    ax_wave.set_ylim(-1, 1)
+    ax_wave.set_ylabel('Amplitude')
+    ax_wave.set_title('Audio Waveform')
+    image = ax_spec.imshow(spectrogram, origin='lower', aspect='auto', extent=[-seconds, 0, 0, sample_rate / 2],
+                           vmin=-100, vmax=0, animated=True)
+    ax_spec.set_xlabel('Time (s)')
+    ax_spec.set_ylabel('Frequency (Hz)')
+
+    plt.show(block=False)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    artists = [(ax_wave, upper_line), (ax_wave, lower_line), (ax_spec, image)]
+
+    pending = np.zeros(0, dtype=np.float32)
+    next_frame = time.perf_counter()
+    while plt.fignum_exists(fig.number):
+        # wait for audio until the next frame is due, then take everything that arrived
+        new = []
+        try:
+            new.append(chunks.get(timeout=max(next_frame - time.perf_counter(), 0.001)))
+            while True:
+                new.append(chunks.get_nowait())
+        except queue.Empty:
+            pass
+        if any(chunk is None for chunk in new):
+            break
+        if new:
+            pending = np.concatenate([pending] + new)
+
+        if time.perf_counter() < next_frame:
+            continue
+        next_frame = time.perf_counter() + 1 / fps
+
+        count = len(pending) // column_length
+        if count:
+            block = pending[:count * column_length].reshape(count, column_length)[-columns:]
+            pending = pending[count * column_length:]
+            count = len(block)
+
+            # only the new columns are computed, the old ones scroll left
+            for values, new_values in ((lower, block.min(axis=1)), (upper, block.max(axis=1))):
+                values[:-count] = values[count:]
+                values[-count:] = new_values
+            power = np.abs(np.fft.rfft(block[:, -fft_length:] * window, axis=1)) ** 2
+            spectrogram[:, :-count] = spectrogram[:, count:]
+            spectrogram[:, -count:] = 10 * np.log10(power.T + 1e-10)
+
+            upper_line.set_ydata(upper)
+            lower_line.set_ydata(lower)
+            image.set_data(spectrogram)
+            fig.canvas.restore_region(background)
+            for ax, artist in artists:
+                ax.draw_artist(artist)
+            fig.canvas.blit(fig.bbox)
+        fig.canvas.flush_events()
+
+    plt.close(fig)
@@ -0,0 +1,71 @@
+import string
+
+
+def normalize_word(word):
+    return word.strip().strip(string.punctuation).lower()
+
+
+class IncrementalTranscriber:
+    """Transcribes a growing phrase without re-decoding the audio it has already committed.
+
+    Each update decodes only the uncommitted audio in the ring buffer, prompted with the committed text. Words that
+    two consecutive hypotheses agree on (same text, start times within `tolerance` seconds) are committed and the
+    audio up to the end of the last committed word is dropped from the buffer, so the decoded window stays bounded
+    no matter how long the phrase runs. When hypotheses keep disagreeing, or several chunks arrive at once, a write
+    could overwrite audio that was never committed. make_room() then commits everything that is buffered first."""
+
+    def __init__(self, model, buffer, tolerance=0.5, prompt_words=50, **transcribe_options):
+        self.model = model
+        self.buffer = buffer
+        self.tolerance = int(tolerance * buffer.sample_rate)
+        self.prompt_words = prompt_words
+        self.transcribe_options = transcribe_options
+        self.committed = []
+        self.tail = []  # uncommitted (start, end, word) of the last hypothesis, in stream samples
+
+    @property
+    def text(self):
+        return ''.join(self.committed + [word for _, _, word in self.tail]).strip()
+
+    def reset(self):
+        """Starts a new phrase"""
+        self.committed = []
+        self.tail = []
+
+    def _hypothesis(self, audio, offset):
+        prompt = ''.join(self.committed[-self.prompt_words:]).strip()
+        result = self.model.transcribe(audio, initial_prompt=prompt or None, word_timestamps=True,
+                                       condition_on_previous_text=False, **self.transcribe_options)
+        sample_rate = self.buffer.sample_rate
+        return [(offset + int(word['start'] * sample_rate), offset + int(word['end'] * sample_rate), word['word'])
+                for segment in result['segments'] for word in segment.get('words', [])]
+
+    def update(self):
+        """Decodes the uncommitted audio, commits the stable prefix and returns the text of the phrase so far"""
+        if len(self.buffer) == 0:
+            return self.text
+
+        words = self._hypothesis(self.buffer.view(), self.buffer.start)
+
+        # the longest prefix this hypothesis shares with the previous one is considered stable
+        stable = 0
+        for (start, _, word), (previous_start, _, previous_word) in zip(words, self.tail):
+            if normalize_word(word) != normalize_word(previous_word) or abs(start - previous_start) > self.tolerance:
+                break
+            stable += 1
+
+        if stable:
+            self.committed.extend(word for _, _, word in words[:stable])
+            self.buffer.discard(max(words[stable - 1][1] - self.buffer.start, 0))
+        self.tail = words[stable:]
+        return self.text
+
+    def make_room(self, n):
+        """Called before n samples are written, commits the whole buffer when the write would overwrite uncommitted
+        audio. The buffer is decoded once more since the last hypothesis doesn't cover the newest audio."""
+        if len(self.buffer) + n <= self.buffer.capacity or len(self.buffer) == 0:
+            return
+        words = self._hypothesis(self.buffer.view(), self.buffer.start)
+        self.committed.extend(word for _, _, word in words)
+        self.tail = []
+        self.buffer.clear()
@@ -0,0 +1,105 @@
+import numpy as np
+import torch
+import whisper
+from numpy.lib.stride_tricks import sliding_window_view
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, mel_filters
+
+from cpu_inference import first_pass_options
+from ring_buffer import RingBuffer
+
+# log10 of whisper's 1e-10 floor, the value of every frame of the zero padding
+SILENT = -10.0
+
+
+class MelCache:
+    """Whisper's log-mel frontend kept in step with a RingBuffer of audio.
+
+    Frame k is centered on stream sample k * HOP_LENGTH, like whisper's centered STFT, so a frame only depends on
+    the stream and not on where the window currently starts. update() computes the frames whose audio is complete
+    since the last call and keeps their raw log10 mel energies in a ring buffer of their own, so the per-update cost
+    scales with the new audio rather than the window. Frames of samples that left the audio buffer are skipped by
+    features(). The normalization depends on the whole segment, so it is applied when the features are assembled.
+
+    The features are close to, but not the same as, log_mel_spectrogram of buffer.view(). Frames stay on the stream's
+    grid of HOP_LENGTH samples instead of starting at the window, so they sit up to HOP_LENGTH - 1 samples off
+    whisper's frames, and the first frame of the stream is padded with zeros where whisper reflects the audio."""
+
+    def __init__(self, buffer, n_mels=80):
+        self.buffer = buffer
+        self.window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)  # torch.hann_window is periodic
+        self.filters = mel_filters('cpu', n_mels).numpy().T
+        self.frames = RingBuffer(buffer.capacity // HOP_LENGTH + 2, buffer.sample_rate / HOP_LENGTH, n_mels)
+
+    def _log_mel(self, audio):
+        """Raw log10 mel frames of audio, every HOP_LENGTH samples"""
+        frames = sliding_window_view(audio, N_FFT)[::HOP_LENGTH]
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        return np.log10(np.maximum(power @ self.filters, 1e-10)).astype(np.float32)
+
+    def _audio(self, start, stop):
+        """Stream samples [start, stop), zeros where they are not buffered"""
+        audio = np.zeros(stop - start, dtype=np.float32)
+        buffered = self.buffer.view()
+        lo, hi = max(start, self.buffer.start), min(stop, self.buffer.total)
+        if hi > lo:
+            audio[lo - start:hi - start] = buffered[lo - self.buffer.start:hi - self.buffer.start]
+        return audio
+
+    def update(self):
+        """Computes the frames whose whole FFT window has been captured"""
+        half = N_FFT // 2
+        first = max(self.frames.total, -(-self.buffer.start // HOP_LENGTH))
+        last = (self.buffer.total - half) // HOP_LENGTH
+        if first > self.frames.total:
+            # frames of audio that was dropped before it was measured, never part of a window again
+            skipped = min(first - self.frames.total, self.frames.capacity)
+            self.frames.write(np.full((skipped, self.frames.channels), SILENT, dtype=np.float32))
+            self.frames.total = first
+        if last >= first:
+            audio = self._audio(first * HOP_LENGTH - half, last * HOP_LENGTH + half)
+            self.frames.write(self._log_mel(audio))
+
+    def features(self):
+        """Whisper's normalized (n_mels, N_FRAMES) input for the buffered audio, the newest 30 s of it when longer"""
+        self.update()
+        half = N_FFT // 2
+        first = -(-self.buffer.start // HOP_LENGTH)
+        cached = self.frames.view(max(self.frames.total - first, 0))
+
+        # the newest frames still miss part of their window, whisper pads the end of the audio with zeros
+        end = -(-(self.buffer.total + half) // HOP_LENGTH)
+        tail = np.zeros((0, self.frames.channels), dtype=np.float32)
+        if end > self.frames.total:
+            start = self.frames.total * HOP_LENGTH - half
+            tail = self._log_mel(self._audio(start, (end - 1) * HOP_LENGTH + half))
+
+        log_spec = np.full((N_FRAMES, self.frames.channels), SILENT, dtype=np.float32)
+        content = np.concatenate((cached, tail))[-N_FRAMES:]
+        log_spec[:len(content)] = content
+        log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+        return torch.from_numpy(((log_spec + 4.0) / 4.0).T.copy())
+
+
+class MelTranscriber:
+    """WindowTranscriber counterpart that decodes the rolling window from cached mel frames.
+
+    The window is handed to whisper.decode as one segment, which skips transcribe's frontend and its temperature
+    fallback, only the first temperature of transcribe_options is used, with the options of that pass."""
+
+    def __init__(self, model, buffer, **transcribe_options):
+        self.model = model
+        self.buffer = buffer
+        self.cache = MelCache(buffer, model.dims.n_mels)
+        options = first_pass_options(transcribe_options)
+        self.options = whisper.DecodingOptions(
+            temperature=options['temperature'], beam_size=options.get('beam_size'), best_of=options.get('best_of'),
+            language=options.get('language'), fp16=options.get('fp16', True))
+
+    def reset(self):
+        pass
+
+    def update(self):
+        if len(self.buffer) == 0:
+            return ''
+        mel = self.cache.features().to(self.model.device)
+        return whisper.decode(self.model, mel, self.options).text.strip()
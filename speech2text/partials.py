@@ -0,0 +1,30 @@
+import numpy as np
+from pocketsphinx import Decoder
+
+
+class SphinxPartials:
+    """Streaming pocketsphinx recognizer for provisional captions.
+
+    Every chunk is fed into the current utterance and the hypothesis so far is returned right away, so the cost per
+    update is one chunk of decoding whatever the Whisper model size. Needs pocketsphinx 5, whose Decoder loads the
+    bundled US English model by default."""
+
+    def __init__(self, sample_rate=16000, **config):
+        self.decoder = Decoder(samprate=sample_rate, **config)
+        self.in_utterance = False
+
+    def reset(self):
+        """Starts a new phrase"""
+        if self.in_utterance:
+            self.decoder.end_utt()
+            self.in_utterance = False
+
+    def update(self, samples):
+        """Feeds float32 samples and returns the hypothesis of the phrase so far"""
+        if not self.in_utterance:
+            self.decoder.start_utt()
+            self.in_utterance = True
+        pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+        self.decoder.process_raw(pcm.tobytes(), False, False)
+        hypothesis = self.decoder.hyp()
+        return hypothesis.hypstr if hypothesis is not None else ''
@@ -0,0 +1,364 @@
+import threading
+import time
+from collections import namedtuple
+from queue import Empty, Full, Queue
+
+from process import SilenceDetector
+from ring_buffer import RingBuffer
+from telemetry import Telemetry
+
+# audio that passed voice detection, phrase counts up every time a pause longer than phrase_timeout is seen
+Chunk = namedtuple('Chunk', ['samples', 'captured_at', 'phrase'])
+Caption = namedtuple('Caption', ['phrase', 'text', 'captured_at'])
+Partial = namedtuple('Partial', ['phrase', 'text', 'captured_at'])
+Location = namedtuple('Location', ['location', 'captured_at'])
+
+# seconds whisper decodes at once, tiered captions decode a phrase in pieces of at most this length
+PHRASE_PIECE = 30
+
+
+def put_latest(queue, item):
+    """Puts an item without blocking, dropping the oldest queued items while the queue is full"""
+    while True:
+        try:
+            queue.put_nowait(item)
+            return
+        except Full:
+            try:
+                queue.get_nowait()
+            except Empty:
+                pass
+
+
+def drain(queue, first):
+    """Returns first followed by everything else that is already waiting in the queue"""
+    items = [first]
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Empty:
+            return items
+
+
+class WindowTranscriber:
+    """Re-transcribes the whole rolling window on every update, the counterpart of IncrementalTranscriber"""
+
+    def __init__(self, model, buffer, **transcribe_options):
+        self.model = model
+        self.buffer = buffer
+        self.transcribe_options = transcribe_options
+
+    def reset(self):
+        pass
+
+    def update(self):
+        if len(self.buffer) == 0:
+            return ''
+        return self.model.transcribe(self.buffer.view(), **self.transcribe_options)['text'].strip()
+
+
+class LivePipeline:
+    """The live subtitle path as concurrent stages connected by bounded queues:
+
+        capture -> voice detection -> localization -> caption output
+                                   -> ASR          ->
+
+    Capture writes every chunk once into a shared ring buffer, with one interleaved channel per microphone, and
+    the stages read views of it: localization gets the newest window of all channels and ASR a mono downmix of
+    each chunk, so both see the same audio at the same time.
+
+    Every stage blocks on its input queue. Capture, localization and ASR never wait on a slower consumer: when a
+    queue is full the oldest audio is dropped, and the ASR and localization stages coalesce everything that queued
+    up while they were busy into a single update of their rolling window. Audio older than the window could not
+    be transcribed anyway, so the ASR queue only holds one window's worth of chunks and caption latency stays
+    bounded by one window plus one decode, however far behind real time the model is.
+
+    Phrases end after phrase_timeout without speech chunks, or, with a silence threshold, once the audio itself has
+    been silent for min_silence, which also ends phrases of sources that never pause.
+
+    With a partial recognizer the captions are tiered: it captions every chunk as soon as it arrives, and ASR only
+    runs once a phrase has ended, replacing the provisional caption of that phrase in place with its final text."""
+
+    def __init__(self, make_transcriber, *, sample_rate, window, chunk_duration, phrase_timeout, locate=None,
+                 location_window=None, detector=None, on_caption=None, on_location=None, telemetry=None,
+                 channels=1, partials=None, silence_threshold=None, min_silence=None):
+        """
+        make_transcriber: called with the ASR ring buffer, returns an object with update() -> text and reset(), and
+            optionally make_room(n), called before a write of n samples would overwrite the oldest buffered ones
+        window (float): seconds of the current phrase kept for transcription, tiered captions decode the whole phrase
+        chunk_duration (float): the expected length of a captured chunk in seconds, sizes the queues
+        locate: optional callable from a window of audio, shape (samples, channels) when multichannel, to a location
+        location_window (int): samples per channel handed to locate, one second by default
+        detector: optional callable from a chunk of samples to whether it contains speech
+        on_caption: called with the transcription list whenever it changes
+        on_location: called with every new location
+        telemetry (Telemetry): receives the per-stage timings, see the metrics below
+        channels (int): channels per captured frame
+        partials: optional streaming recognizer with update(samples) -> text and reset(), enables tiered captions
+        silence_threshold (float): magnitude below which the audio counts as silent. When set, `min_silence` seconds
+            of silent audio after sound end the phrase and the silence that follows isn't transcribed, which also
+            works for sources that deliver audio without pauses
+        min_silence (float): seconds of silence that end a phrase, phrase_timeout by default
+
+        metrics:
+            queue_delay: capture callback to voice detection dequeue
+            vad, speech: detector time per chunk and the fraction of chunks it let through
+            buffer: writing the coalesced chunks into the ASR window
+            localization: one locate call
+            asr: one transcriber update
+            rtf: asr time over the seconds of new audio it covered
+            partial: one partial recognizer update
+            caption_latency: end of the newest audio to its caption being shown
+            partial_latency: the same for provisional captions"""
+        self.make_transcriber = make_transcriber
+        self.sample_rate = sample_rate
+        self.window = int(window * sample_rate)
+        self.location_window = location_window or sample_rate
+        self.phrase_timeout = phrase_timeout
+        self.locate = locate
+        self.detector = detector
+        self.on_caption = on_caption or (lambda transcription: print(transcription[-1]))
+        self.on_location = on_location or (lambda location: print("Location: ", location))
+        self.telemetry = telemetry or Telemetry()
+        self.partials = partials
+        self.silence = None
+        if silence_threshold is not None:
+            min_silence = phrase_timeout if min_silence is None else min_silence
+            history = RingBuffer(int((min_silence + 2 * chunk_duration) * sample_rate), sample_rate)
+            self.silence = SilenceDetector(history, silence_threshold, min_silence=min_silence)
+
+        chunks_per_window = int(window / chunk_duration) + 1
+        self.capture_queue = Queue(maxsize=4 * chunks_per_window)
+        self.asr_queue = Queue(maxsize=chunks_per_window)
+        self.location_queue = Queue(maxsize=chunks_per_window)
+        self.partial_queue = Queue(maxsize=chunks_per_window)
+        # the views wait in the capture queue and then, for the location windows, in the location queue, plus one
+        # being read by each and one being written. ASR and partials get copies made by voice detection
+        chunks = self.capture_queue.maxsize + self.location_queue.maxsize + 2
+        capacity = chunks * int(chunk_duration * sample_rate) + self.location_window
+        self.capture = RingBuffer(capacity, sample_rate, channels)
+        self.caption_queue = Queue(maxsize=64)
+
+        self.transcription = ['']
+        self.line_times = [None]  # captured_at of the newest audio in the first caption of every line
+        self.location = None
+        self.threads = []
+
+    def start(self):
+        stages = [self._detect, self._transcribe, self._caption]
+        if self.locate is not None:
+            stages.append(self._localize)
+        if self.partials is not None:
+            stages.append(self._partial)
+        for stage in stages:
+            thread = threading.Thread(target=stage, name=stage.__name__.strip('_'), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def feed(self, samples, captured_at=None):
+        """Capture stage entry point, must be called from one recording thread and never blocks it"""
+        captured_at = time.perf_counter() if captured_at is None else captured_at
+        self.capture.write(samples)
+        chunk = self.capture.view(len(samples))
+        window = self.capture.view(self.location_window) if self.locate is not None else None
+        put_latest(self.capture_queue, (chunk, window, captured_at))
+
+    def wait(self):
+        for thread in self.threads:
+            thread.join()
+
+    def stop(self):
+        """Lets the stages finish the queued audio and waits for them"""
+        self.capture_queue.put(None)
+        self.wait()
+
+    # Stages -------------------------------------------------------------------------------------
+    def _silence(self, samples):
+        """Follows the silence of the stream, returns (whether the audio since the last endpoint has sound, whether
+        the phrase just ended)"""
+        self.silence.buffer.write(samples)
+        self.silence.update()
+        start, end = self.silence.boundaries()
+        if not self.silence.endpoint():
+            return end > start, False
+        self.silence.buffer.clear()
+        return True, True
+
+    def _detect(self):
+        phrase, last_speech = 0, None
+        ended = False  # the silence detector saw the end of the phrase
+        while True:
+            item = self.capture_queue.get()
+            if item is None:
+                break
+            samples, window, captured_at = item
+            self.telemetry.record('queue_delay', time.perf_counter() - captured_at)
+            # a copy, so the chunk stays valid however long it waits for ASR and partials
+            samples = samples.mean(axis=1) if samples.ndim > 1 else samples.copy()
+            if self.detector is not None:
+                with self.telemetry.timer('vad'):
+                    speech = self.detector(samples)
+                self.telemetry.record('speech', float(speech))
+                if not speech:
+                    continue
+
+            # If enough time has passed between speech chunks, consider the phrase complete.
+            new_phrase = last_speech is not None and captured_at - last_speech > self.phrase_timeout
+
+            # or enough silent audio, the silence after it is skipped until sound returns
+            endpoint = False
+            if self.silence is not None:
+                sound, endpoint = self._silence(samples)
+                if ended and not sound:
+                    continue
+                new_phrase = new_phrase or ended
+
+            if new_phrase:
+                phrase += 1
+            last_speech = captured_at
+            ended = endpoint
+
+            put_latest(self.asr_queue, Chunk(samples, captured_at, phrase))
+            if self.locate is not None:
+                put_latest(self.location_queue, Chunk(window, captured_at, phrase))
+            if self.partials is not None:
+                put_latest(self.partial_queue, Chunk(samples, captured_at, phrase))
+
+        self.asr_queue.put(None)
+        if self.locate is not None:
+            self.location_queue.put(None)
+        if self.partials is not None:
+            self.partial_queue.put(None)
+
+    def _localize(self):
+        while True:
+            # only the newest window matters, older ones queued while the last locate call ran are skipped
+            items = drain(self.location_queue, self.location_queue.get())
+            chunks = [item for item in items if item is not None]
+            if chunks:
+                with self.telemetry.timer('localization'):
+                    location = self.locate(chunks[-1].samples)
+                self.caption_queue.put(Location(location, chunks[-1].captured_at))
+            if len(chunks) < len(items):
+                self.caption_queue.put(None)
+                return
+
+    def _partial(self):
+        phrase = None
+        while True:
+            # the recognizer has to hear every chunk, but only the newest hypothesis is shown
+            items = drain(self.partial_queue, self.partial_queue.get())
+            for chunk, following in zip(items, items[1:] + [None]):
+                if chunk is None:
+                    self.caption_queue.put(None)
+                    return
+                if chunk.phrase != phrase:
+                    self.partials.reset()
+                    phrase = chunk.phrase
+                with self.telemetry.timer('partial'):
+                    text = self.partials.update(chunk.samples)
+                if following is None or following.phrase != phrase:
+                    self.caption_queue.put(Partial(phrase, text, chunk.captured_at))
+
+    def _transcribe(self):
+        # tiered captions replace the partials of the whole phrase, so the whole phrase is kept instead of a window
+        tiered = self.partials is not None
+        buffer = RingBuffer(PHRASE_PIECE * self.sample_rate if tiered else self.window, self.sample_rate)
+        transcriber = self.make_transcriber(buffer)
+        phrase = None
+        pieces = []  # text of the earlier pieces of a tiered phrase longer than the buffer
+        new_audio = 0
+
+        def write(chunks):
+            nonlocal phrase, new_audio
+            with self.telemetry.timer('buffer'):
+                if chunks[0].phrase != phrase:
+                    buffer.clear()
+                    transcriber.reset()
+                    pieces.clear()
+                    phrase = chunks[0].phrase
+                for chunk in chunks:
+                    if len(buffer) + len(chunk.samples) > buffer.capacity:
+                        if tiered:
+                            pieces.append(transcriber.update())
+                            buffer.clear()
+                            transcriber.reset()
+                        elif hasattr(transcriber, 'make_room'):
+                            transcriber.make_room(len(chunk.samples))
+                    buffer.write(chunk.samples)
+            new_audio += sum(len(chunk.samples) for chunk in chunks)
+
+        def decode(captured_at):
+            nonlocal new_audio
+            with self.telemetry.timer('asr', phrase=phrase) as timer:
+                text = ' '.join(piece for piece in pieces + [transcriber.update()] if piece)
+            self.telemetry.record('rtf', timer.elapsed * self.sample_rate / new_audio)
+            new_audio = 0
+            print(f"Transcribed in {round(timer.elapsed, 2)} seconds")
+            self.caption_queue.put(Caption(phrase, text, captured_at))
+
+        if tiered:
+            # tiered: the phrase is only decoded once it ended, i.e. the next phrase started, no speech came for
+            # phrase_timeout or the stream stopped
+            last = None
+            while True:
+                try:
+                    item = self.asr_queue.get(timeout=None if last is None else self.phrase_timeout)
+                except Empty:
+                    item = False
+                if last is not None and (not item or item.phrase != phrase):
+                    decode(last.captured_at)
+                    last = None
+                if item is None:
+                    self.caption_queue.put(None)
+                    return
+                if item:
+                    write([item])
+                    last = item
+
+        while True:
+            # coalesce everything that arrived during the last decode, but finish a phrase before starting the next
+            chunks = []
+            for item in drain(self.asr_queue, self.asr_queue.get()):
+                if chunks and (item is None or item.phrase != chunks[-1].phrase):
+                    write(chunks)
+                    decode(chunks[-1].captured_at)
+                    chunks = []
+                if item is None:
+                    self.caption_queue.put(None)
+                    return
+                chunks.append(item)
+            write(chunks)
+            decode(chunks[-1].captured_at)
+
+    def _caption(self):
+        producers = 1 + (self.locate is not None) + (self.partials is not None)
+        lines = {0: 0}  # phrase -> its line in the transcription
+        final = set()
+        while producers:
+            item = self.caption_queue.get()
+            if item is None:
+                producers -= 1
+            elif isinstance(item, Location):
+                self.location = item.location
+                self.on_location(item.location)
+            else:
+                # If we detected a pause between recordings, add a new item to our transcription.
+                # Otherwise, edit the existing one.
+                if item.phrase not in lines:
+                    lines[item.phrase] = len(self.transcription)
+                    self.transcription.append('')
+                    self.line_times.append(None)
+                if self.line_times[lines[item.phrase]] is None:
+                    self.line_times[lines[item.phrase]] = item.captured_at
+                if isinstance(item, Partial):
+                    # a late provisional caption never replaces the final text
+                    if item.phrase in final:
+                        continue
+                    self.telemetry.record('partial_latency', time.perf_counter() - item.captured_at)
+                else:
+                    self.telemetry.record('caption_latency', time.perf_counter() - item.captured_at)
+                    if self.partials is not None:
+                        final.add(item.phrase)
+                self.transcription[lines[item.phrase]] = item.text
+                self.on_caption(self.transcription)
@@ -3,36 +3,107 @@ import soundfile as sf
 import wave
 from pydub import AudioSegment
 
+from ring_buffer import RingBuffer
+
 import shutil
 import os
 
+def pcm_to_float32(data, sample_width=2):
+    """Converts raw little-endian PCM bytes to float32 samples in [-1, 1)"""
+    dtype = {2: np.int16, 4: np.int32}[sample_width]
+    return np.frombuffer(data, dtype=dtype).astype(np.float32) / np.float32(2 ** (8 * sample_width - 1))
+
+
+def silence_boundaries(audio_data, energy_threshold, cons=1600):
+    """Vectorized boundaries of the sound in a recording, O(n) in its length
+    input:
+        audio_data (np.array): samples, (samples,) or (samples, channels)
+        energy_threshold (float): magnitude below which a sample counts as silent
+        cons (int): consecutive silent samples that end the sound
+    output:
+        start_index (int): the first sample at or above the threshold, len(audio_data) when there is none
+        end_index (int): the start of the first run of cons silent samples after start_index, otherwise the length"""
+    magnitude = np.abs(audio_data)
+    if magnitude.ndim > 1:
+        magnitude = magnitude.max(axis=1)
+    loud = magnitude >= energy_threshold
+
+    start_index = int(np.argmax(loud)) if loud.any() else len(loud)
+    # loud samples in every window of cons samples, from a cumulative sum instead of rescanning each window
+    counts = np.concatenate(([0], np.cumsum(loud[start_index:])))
+    silent = np.flatnonzero(counts[cons:] == counts[:-cons]) if len(counts) > cons else []
+    end_index = start_index + int(silent[0]) if len(silent) else len(loud)
+    return start_index, end_index
+
+
 def remove_silence(audio_file, energy_threshold):
     # Read the audio file
     audio_data, sample_rate = sf.read(audio_file)
 
-    # remove the silence at the beginning
-    start_index = np.where(audio_data > energy_threshold)[0][0]
-    audio_data = audio_data[start_index:]
-
-    # remove the silence at the end
-    cons = 1600
-    end_index = len(audio_data)
-    for i in range(end_index - cons + 1):
-        if np.all(audio_data[i:i + cons] < energy_threshold):
-            audio_data = audio_data[:i]
-            end_index = i
-            break
+    # keep the audio from the first loud sample up to the first long enough silence
+    start_index, end_index = silence_boundaries(audio_data, energy_threshold)
+    removed_end = len(audio_data) - end_index
+    audio_data = audio_data[start_index:end_index]
 
     # Write the modified audio data back to the file
     sf.write(audio_file, audio_data, sample_rate, format='WAV')
 
     # Calculate the duration of removed portions
     removed_start_duration = start_index / sample_rate
-    removed_end_duration = (len(audio_data) - end_index) / sample_rate
+    removed_end_duration = removed_end / sample_rate
 
     return removed_start_duration, removed_end_duration
 
 
+class SilenceDetector:
+    """Streaming leading/trailing silence boundaries of a RingBuffer, without any file writes.
+
+    The buffered stream is split into blocks of block_duration seconds and update() only measures the blocks
+    completed since the last call, so it can run on every live iteration. A block is silent when all of its samples
+    are below the threshold, like remove_silence, and its peak magnitude is kept in a ring buffer of its own that
+    follows the audio buffer, including samples it discarded or overwrote."""
+
+    def __init__(self, buffer, energy_threshold, block_duration=0.01, min_silence=0.1):
+        self.buffer = buffer
+        self.energy_threshold = energy_threshold
+        self.block_length = max(int(block_duration * buffer.sample_rate), 1)
+        self.min_silence = int(min_silence * buffer.sample_rate)
+        self.levels = RingBuffer(buffer.capacity // self.block_length + 1, buffer.sample_rate / self.block_length)
+
+    def update(self):
+        """Measures the newly completed blocks of the buffer"""
+        blocks = self.buffer.total // self.block_length
+        first = blocks - self.levels.total
+        if first <= 0:
+            return
+        # blocks that already left the buffer can't be measured, they are marked silent
+        available = max(min(first, blocks + self.buffer.start // -self.block_length), 0)
+        audio = self.buffer.view(self.buffer.total - (blocks - available) * self.block_length)
+        audio = audio[:available * self.block_length]
+        if audio.ndim > 1:
+            audio = np.abs(audio).max(axis=1)
+        levels = np.abs(audio).reshape(available, self.block_length).max(axis=1)
+        self.levels.write(np.concatenate((np.zeros(first - available, dtype=np.float32), levels)))
+
+    def boundaries(self):
+        """Returns (start, end) of the sound in buffer.view(), (0, 0) when everything is silent"""
+        # the oldest block may be partly discarded and the newest samples not complete a block yet
+        buffer_start = self.buffer.start
+        first_block = buffer_start // self.block_length
+        count = max(self.levels.total - first_block, 0)
+        loud = np.flatnonzero(self.levels.view(count) >= self.energy_threshold)
+        if len(loud) == 0:
+            return 0, 0
+        start = max((first_block + int(loud[0])) * self.block_length - buffer_start, 0)
+        end = (first_block + int(loud[-1]) + 1) * self.block_length - buffer_start
+        return start, end
+
+    def endpoint(self):
+        """Whether the buffer holds sound followed by at least min_silence of silence"""
+        start, end = self.boundaries()
+        return end > start and len(self.buffer) - end >= self.min_silence
+
+
 def append_to_wav(existing_file, temp_file):
     infiles = [existing_file, temp_file]
     outfile = "rolling_audio.wav"
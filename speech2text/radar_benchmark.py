@@ -0,0 +1,141 @@
+import argparse
+import time
+
+import numpy as np
+
+import complete_radar
+from replay import expand_paths, load_wav
+
+DEFAULT_AUDIO = ['../data/archive/*.wav']
+
+# the glasses' geometry, the first microphone is the origin
+MICRO2 = np.array([8, -16])
+MICRO3 = np.array([-8, -16])
+SPEED_OF_SOUND = 34314  # cm/s
+
+
+def fractional_delay(audio, delay):
+    """Delays audio by a fractional number of samples with an exact phase shift, zero padded so nothing wraps"""
+    n = complete_radar.fft_length(len(audio) + int(np.ceil(abs(delay))) + 1)
+    frequencies = np.fft.rfftfreq(n)
+    return np.fft.irfft(np.fft.rfft(audio, n) * np.exp(-2j * np.pi * frequencies * delay), n)[:len(audio)]
+
+
+def render(audio, source, rate, snr, rng):
+    """The three microphone signals of a point source, with the exact propagation delay and 1 / r attenuation of
+    each microphone and white noise at snr dB below the loudest one"""
+    microphones = np.array([[0, 0], MICRO2, MICRO3])
+    ranges = np.linalg.norm(source - microphones, axis=1)
+    sounds = [fractional_delay(audio, distance * rate / SPEED_OF_SOUND) * ranges.min() / distance
+              for distance in ranges]
+    noise = np.sqrt(np.mean(sounds[np.argmin(ranges)] ** 2) / 10 ** (snr / 10))
+    return [sound + rng.normal(0, noise, len(sound)) for sound in sounds]
+
+
+def estimators(rate, min_dist, max_dist):
+    """The localization functions under test, each from three sounds and a window size to a location or None"""
+    table = complete_radar.build_delay_table(MICRO2, MICRO3, min_dist, max_dist, rate, SPEED_OF_SOUND)
+    grid = complete_radar.srp_grid(np.array([[0, 0], MICRO2, MICRO3]), min_dist, max_dist, rate, SPEED_OF_SOUND)
+    common = dict(min_dist=min_dist, max_dist=max_dist, local_rate=rate, sos_local=SPEED_OF_SOUND)
+
+    def srp(sounds, window):
+        locations, _ = complete_radar.radar_sources(MICRO2, MICRO3, *sounds, k=1, size_window=window, grid=grid,
+                                                    **common)
+        return locations[0] if len(locations) else None
+
+    return {
+        'sliding': lambda sounds, window: complete_radar.radar(MICRO2, MICRO3, *sounds, size_window=window,
+                                                               method='sliding', **common),
+        'gcc_phat': lambda sounds, window: complete_radar.radar(MICRO2, MICRO3, *sounds, size_window=window,
+                                                                **common),
+        'least_squares': lambda sounds, window: complete_radar.radar(MICRO2, MICRO3, *sounds, size_window=window,
+                                                                     solver='least_squares', **common),
+        'table': lambda sounds, window: complete_radar.radar(MICRO2, MICRO3, *sounds, size_window=window,
+                                                             table=table, **common),
+        'srp_phat': srp,
+    }
+
+
+def angle_error(location, source):
+    """Degrees between the directions of a location and the source, seen from the first microphone"""
+    difference = np.arctan2(location[1], location[0]) - np.arctan2(source[1], source[0])
+    return np.degrees(np.abs(np.angle(np.exp(1j * difference))))
+
+
+def run(recordings, rate, window, snr, trials, min_dist, max_dist, seed):
+    """Localizes `trials` random sources with every estimator and returns one result row per estimator"""
+    rng = np.random.default_rng(seed)
+    methods = estimators(rate, min_dist, max_dist)
+    results = {name: {'errors': [], 'angles': [], 'failures': 0, 'seconds': []} for name in methods}
+
+    for _ in range(trials):
+        # a random source around the array and a random stretch of a recording with enough level to localize
+        angle = rng.uniform(-np.pi, np.pi)
+        distance = rng.uniform(max(min_dist, 25), max_dist)
+        source = distance * np.array([np.cos(angle), np.sin(angle)])
+        audio = recordings[rng.integers(len(recordings))]
+        for _ in range(10):
+            start = rng.integers(max(len(audio) - window, 1))
+            if np.mean(audio[start:start + window] ** 2) >= 0.25 * np.mean(audio ** 2):
+                break
+        sounds = render(audio[start:start + window], source, rate, snr, rng)
+
+        for name, method in methods.items():
+            begin = time.perf_counter()
+            location = method(sounds, window)
+            results[name]['seconds'].append(time.perf_counter() - begin)
+            if location is None or not np.all(np.isfinite(location)):
+                results[name]['failures'] += 1
+                continue
+            results[name]['errors'].append(np.linalg.norm(location - source))
+            results[name]['angles'].append(angle_error(location, source))
+
+    rows = []
+    for name, result in results.items():
+        rows.append({
+            'method': name, 'rate': rate, 'window': window, 'snr': snr,
+            'error_cm': np.median(result['errors']) if result['errors'] else None,
+            'angle_deg': np.median(result['angles']) if result['angles'] else None,
+            'failure_rate': result['failures'] / trials,
+            'ms_mean': 1000 * np.mean(result['seconds']),
+            'ms_p90': 1000 * np.percentile(result['seconds'], 90),
+        })
+    return rows
+
+
+def format_row(row):
+    def number(value, digits=2):
+        return '-' if value is None else f"{value:.{digits}f}"
+
+    return (f"{row['method']:<15}{row['rate']:>7}{row['window']:>8}{row['snr']:>6}{number(row['error_cm'], 1):>10}"
+            f"{number(row['angle_deg'], 1):>10}{number(row['failure_rate']):>9}{number(row['ms_mean']):>9}"
+            f"{number(row['ms_p90']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates sources at known positions around the glasses' "
+                                                 "microphones and reports the accuracy and speed of the radar "
+                                                 "localization functions.")
+    parser.add_argument("audio", nargs='*', default=DEFAULT_AUDIO, help="WAV files or glob patterns to render.")
+    parser.add_argument("--rates", nargs='+', default=[16000, 44100], type=int)
+    parser.add_argument("--windows", nargs='+', default=[2000, 5000], type=int, help="Samples per radar window.")
+    parser.add_argument("--snrs", nargs='+', default=[30, 10], type=float, help="Noise levels in dB.")
+    parser.add_argument("--trials", default=100, type=int, help="Random sources per configuration.")
+    parser.add_argument("--min_dist", default=3, type=float)
+    parser.add_argument("--max_dist", default=100, type=float)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    filenames = expand_paths(args.audio)
+    print(f"{'method':<15}{'rate':>7}{'window':>8}{'snr':>6}{'err cm':>10}{'err deg':>10}{'fail':>9}"
+          f"{'ms':>9}{'ms p90':>9}")
+    for rate in args.rates:
+        recordings = [load_wav(filename, rate) for filename in filenames]
+        for window in args.windows:
+            for snr in args.snrs:
+                for row in run(recordings, rate, window, snr, args.trials, args.min_dist, args.max_dist, args.seed):
+                    print(format_row(row))
+
+
+if __name__ == "__main__":
+    main()
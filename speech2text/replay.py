@@ -0,0 +1,95 @@
+import glob
+import threading
+import time
+from math import gcd
+
+import numpy as np
+import soundfile as sf
+import speech_recognition as sr
+from scipy.signal import resample_poly
+
+
+def expand_paths(patterns):
+    """Expands glob patterns (quoted on the command line) and keeps plain paths, in order"""
+    filenames = []
+    for pattern in patterns:
+        filenames.extend(sorted(glob.glob(pattern)) or [pattern])
+    return filenames
+
+
+def load_wav(filename, sample_rate=16000, mono=True):
+    """Reads a recording as float32 at sample_rate, shape (samples,) when mono else (samples, channels)"""
+    audio, rate = sf.read(filename, dtype='float32', always_2d=True)
+    if mono:
+        audio = audio.mean(axis=1)
+    if rate != sample_rate:
+        divisor = gcd(sample_rate, rate)
+        audio = resample_poly(audio, sample_rate // divisor, rate // divisor, axis=0).astype(np.float32)
+    return audio
+
+
+class ReplaySource:
+    """Microphone-free stand-in for sr.Microphone that replays recordings through the live path.
+
+    listen_in_background mirrors Recognizer.listen_in_background: the callback receives sr.AudioData chunks of
+    phrase_time_limit seconds from a background thread, paced at `speed` times real time. Files are separated by
+    `gap` seconds without audio, like the pause a microphone sees between phrases.
+
+    With channels > 1 it stands in for MultichannelMicrophone instead and the callback receives float32 frames of
+    shape (samples, channels), the recordings must have at least that many channels."""
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, filenames, sample_rate=16000, speed=1.0, gap=3.0, channels=1):
+        self.filenames = filenames
+        self.SAMPLE_RATE = sample_rate
+        self.channels = channels
+        self.speed = speed
+        self.gap = gap
+        self.finished = threading.Event()
+        self.on_file = None  # optional callable(filename) run before a file's first chunk
+
+    def chunks(self, filename, chunk_duration):
+        """Yields (chunk, seconds of audio in it), sr.AudioData when mono and frames when multichannel"""
+        size = int(chunk_duration * self.SAMPLE_RATE)
+        if self.channels > 1:
+            audio = load_wav(filename, self.SAMPLE_RATE, mono=False)[:, :self.channels]
+            for start in range(0, len(audio), size):
+                chunk = audio[start:start + size]
+                yield chunk, len(chunk) / self.SAMPLE_RATE
+            return
+
+        audio = load_wav(filename, self.SAMPLE_RATE)
+        pcm = (np.clip(audio, -1, 1) * 32767).astype('<i2')
+        for start in range(0, len(pcm), size):
+            chunk = pcm[start:start + size]
+            yield sr.AudioData(chunk.tobytes(), self.SAMPLE_RATE, self.SAMPLE_WIDTH), len(chunk) / self.SAMPLE_RATE
+
+    def listen_in_background(self, callback, phrase_time_limit=1.0):
+        stop_event = threading.Event()
+
+        def run():
+            try:
+                deadline = time.perf_counter()
+                for filename in self.filenames:
+                    if self.on_file:
+                        self.on_file(filename)
+                    for chunk, duration in self.chunks(filename, phrase_time_limit):
+                        # a chunk is only available once all of its audio has been "recorded"
+                        deadline += duration / self.speed
+                        if stop_event.wait(max(deadline - time.perf_counter(), 0)):
+                            return
+                        callback(self, chunk)
+                    deadline += self.gap / self.speed
+            finally:
+                self.finished.set()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        def stopper(wait_for_stop=True):
+            stop_event.set()
+            if wait_for_stop:
+                thread.join()
+            self.finished.set()
+
+        return stopper
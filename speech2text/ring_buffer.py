@@ -0,0 +1,61 @@
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity float32 audio buffer that keeps the newest samples of a stream.
+
+    Every sample is stored twice, `capacity` apart, so the buffered samples always form one contiguous slice and
+    can be handed out as a NumPy view instead of a copy. With several channels the frames are stored interleaved,
+    views have shape (samples, channels) and view()[:, i] is a strided view of channel i."""
+
+    def __init__(self, capacity, sample_rate=16000, channels=1):
+        self.capacity = int(capacity)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        shape = (2 * self.capacity,) if channels == 1 else (2 * self.capacity, channels)
+        self._data = np.zeros(shape, dtype=np.float32)
+        self._end = 0  # position of the next write, in [0, capacity)
+        self.size = 0
+        self.total = 0  # number of samples ever written, i.e. the stream index of the next sample
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def duration(self):
+        return self.size / self.sample_rate
+
+    @property
+    def start(self):
+        """Stream index of the oldest buffered sample"""
+        return self.total - self.size
+
+    def write(self, samples):
+        """Appends samples (frames of shape (n, channels) when multichannel), overwriting the oldest ones once the
+        buffer is full"""
+        samples = np.asarray(samples, dtype=np.float32)
+        self.total += len(samples)
+        samples = samples[-self.capacity:]
+        n = len(samples)
+
+        # write up to the end of the first copy, then wrap around to the front
+        first = min(n, self.capacity - self._end)
+        for offset in (0, self.capacity):
+            self._data[offset + self._end:offset + self._end + first] = samples[:first]
+            self._data[offset:offset + n - first] = samples[first:]
+
+        self._end = (self._end + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def view(self, n=None):
+        """Returns a view of the newest n buffered samples (all of them by default), valid until the next write"""
+        n = self.size if n is None else min(n, self.size)
+        stop = self._end + self.capacity
+        return self._data[stop - n:stop]
+
+    def discard(self, n):
+        """Drops the oldest n samples"""
+        self.size -= min(n, self.size)
+
+    def clear(self):
+        self.size = 0
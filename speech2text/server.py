@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from queue import Empty, Queue
+
+import numpy as np
+import torch
+import whisper
+from whisper.audio import CHUNK_LENGTH, SAMPLE_RATE
+from whisper.tokenizer import get_tokenizer
+
+from batch_transcribe import split_segments
+from cpu_inference import first_pass_options
+from pipeline import LivePipeline, WindowTranscriber
+from vad import VoiceActivityDetector
+
+DEFAULT_SOCKET = '/tmp/glacme1-whisper.sock'
+
+# every message is a 4 byte big-endian header length, a JSON header and `payload` bytes of raw float32 PCM
+_LENGTH = struct.Struct('>I')
+
+
+def send_message(sock, header, payload=b''):
+    header = dict(header, payload=len(payload))
+    encoded = json.dumps(header, default=float).encode()
+    sock.sendall(_LENGTH.pack(len(encoded)) + encoded)
+    if payload:
+        sock.sendall(payload)
+
+
+def _recv_exact(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError("Socket closed mid message")
+        view = view[received:]
+    return bytes(data)
+
+
+def recv_message(sock):
+    """Returns (header, payload), or (None, None) when the peer closed the connection between messages"""
+    length = sock.recv(_LENGTH.size, socket.MSG_WAITALL)
+    if not length:
+        return None, None
+    if len(length) < _LENGTH.size:
+        raise ConnectionError("Socket closed mid message")
+    header = json.loads(_recv_exact(sock, _LENGTH.unpack(length)[0]))
+    return header, _recv_exact(sock, header['payload'])
+
+
+class RemoteModel:
+    """Client for a model server, a drop-in for the whisper model in the live path:
+    transcribe(audio, **options) takes 16 kHz float32 samples and returns the same dictionary as whisper"""
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.lock = threading.Lock()
+
+    def transcribe(self, audio, **options):
+        audio = np.ascontiguousarray(audio, dtype='<f4')
+        with self.lock:
+            send_message(self.sock, {'options': options}, audio.tobytes())
+            header, _ = recv_message(self.sock)
+        if header is None:
+            raise ConnectionError(f"Model server at {self.path} closed the connection")
+        if 'error' in header:
+            raise RuntimeError(header['error'])
+        return header['result']
+
+    def close(self):
+        self.sock.close()
+
+
+class RemoteSession:
+    """Client of a server session, a drop-in for LivePipeline: feed() streams the captured audio to the server,
+    which runs the pipeline for this stream, and every caption update comes back to on_caption"""
+
+    def __init__(self, path=DEFAULT_SOCKET, on_caption=None, **params):
+        """params: the session's sample_rate, window, chunk_duration, phrase_timeout, channels, vad (bool) and the
+        transcribe options, see ModelServer.open_session"""
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.send_lock = threading.Lock()
+        send_message(self.sock, {'session': params})
+        self.on_caption = on_caption or (lambda transcription: print(transcription[-1]))
+        self.transcription = ['']
+        self.reader = threading.Thread(target=self._read, name='session', daemon=True)
+
+    def start(self):
+        self.reader.start()
+
+    def feed(self, samples, captured_at=None):
+        with self.send_lock:
+            send_message(self.sock, {}, np.ascontiguousarray(samples, dtype='<f4').tobytes())
+
+    def wait(self):
+        self.reader.join()
+
+    def stop(self):
+        """Lets the server finish the queued audio and waits for the final transcription"""
+        with self.send_lock:
+            send_message(self.sock, {'stop': True})
+        self.wait()
+        self.sock.close()
+
+    def _read(self):
+        while True:
+            header, _ = recv_message(self.sock)
+            if header is None:
+                return
+            if 'error' in header:
+                raise RuntimeError(header['error'])
+            self.transcription = header['transcription']
+            if header.get('final'):
+                return
+            self.on_caption(self.transcription)
+
+
+class BatchedModel:
+    """Decodes the transcribe calls of many streams together.
+
+    A call blocks while a worker thread collects the calls that arrive within `deadline` seconds of the first one,
+    up to max_batch. Each window is padded to whisper's 30 s input and the windows with the same options go through
+    one batched whisper.decode, so the encoder and decoder run once per batch instead of once per stream. The segments
+    of a batched result come from the timestamp tokens of that single pass, without the per-segment fallback and
+    probabilities of transcribe. Calls that need more than decode offers (word timestamps, prompts) are transcribed
+    on their own."""
+    BATCHED_OPTIONS = {'fp16', 'language', 'temperature', 'beam_size', 'best_of'}
+
+    def __init__(self, model, max_batch=8, deadline=0.05):
+        self.model = model
+        self.max_batch = max_batch
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.requests = Queue()
+        threading.Thread(target=self._run, name='batch', daemon=True).start()
+
+    def transcribe(self, audio, **options):
+        if not set(options) <= self.BATCHED_OPTIONS:
+            with self.lock:
+                return self.model.transcribe(audio, **options)
+
+        request = {'audio': audio, 'options': options, 'done': threading.Event()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['result']
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.deadline
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.requests.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except Empty:
+                    break
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(json.dumps(request['options'], sort_keys=True), []).append(request)
+            for requests in groups.values():
+                self._decode(requests)
+
+    def _decode(self, requests):
+        # decode runs a single pass, so only the first temperature of a fallback ladder is used
+        options = first_pass_options(requests[0]['options'])
+        try:
+            audio = [whisper.pad_or_trim(np.asarray(request['audio'], dtype=np.float32)) for request in requests]
+            mel = torch.stack([whisper.log_mel_spectrogram(window, n_mels=self.model.dims.n_mels)
+                               for window in audio]).to(self.model.device)
+            with self.lock:
+                results = whisper.decode(self.model, mel, whisper.DecodingOptions(without_timestamps=False, **options))
+            for request, result in zip(requests, results):
+                tokenizer = get_tokenizer(self.model.is_multilingual, num_languages=self.model.num_languages,
+                                          language=result.language)
+                duration = min(len(request['audio']) / SAMPLE_RATE, CHUNK_LENGTH)
+                # like transcribe, every segment says the temperature it was decoded at, BudgetedModel counts on it
+                segments = [dict(segment, temperature=options['temperature'])
+                            for segment in split_segments(result.tokens, tokenizer, 0.0, duration)]
+                request['result'] = {'text': result.text, 'segments': segments, 'language': result.language}
+        except Exception as error:
+            for request in requests:
+                request['error'] = error
+        finally:
+            for request in requests:
+                request['done'].set()
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Keeps one warmed-up whisper model in memory and serves every client connected to its socket.
+
+    A client either sends transcribe requests, see RemoteModel, or opens a session and streams audio, see
+    RemoteSession. Every session gets its own LivePipeline, with its own ring buffer, phrase state and
+    transcription, and all of them share the model. With max_batch > 1 the transcriptions of concurrent clients are
+    batched, see BatchedModel."""
+    daemon_threads = True
+
+    def __init__(self, path, model, max_batch=1, deadline=0.05):
+        self.model = BatchedModel(model, max_batch, deadline) if max_batch > 1 else model
+        self.model_lock = threading.Lock()
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _TranscribeHandler)
+
+    def transcribe(self, audio, **options):
+        if isinstance(self.model, BatchedModel):
+            return self.model.transcribe(audio, **options)
+        # one model instance, so requests from different clients take turns
+        with self.model_lock:
+            return self.model.transcribe(audio, **options)
+
+    def open_session(self, params, on_caption):
+        """A pipeline for one stream, params as sent by RemoteSession"""
+        params = dict(params)
+        sample_rate = params.pop('sample_rate', whisper.audio.SAMPLE_RATE)
+        vad = params.pop('vad', False)
+        return LivePipeline(lambda buffer: WindowTranscriber(self, buffer, **params.pop('options', {})),
+                            sample_rate=sample_rate, window=params.pop('window', 3),
+                            chunk_duration=params.pop('chunk_duration', 1),
+                            phrase_timeout=params.pop('phrase_timeout', 2), channels=params.pop('channels', 1),
+                            detector=VoiceActivityDetector(sample_rate) if vad else None, on_caption=on_caption,
+                            on_location=lambda location: None)
+
+
+class _TranscribeHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            header, payload = recv_message(self.request)
+            if header is None:
+                return
+            if 'session' in header:
+                self.serve_session(header['session'])
+                return
+            try:
+                audio = np.frombuffer(payload, dtype='<f4')
+                result = self.server.transcribe(audio, **header.get('options', {}))
+                send_message(self.request, {'result': result})
+            except Exception as error:
+                send_message(self.request, {'error': repr(error)})
+
+    def serve_session(self, params):
+        send_lock = threading.Lock()
+
+        def on_caption(transcription):
+            # a client that went away must not stall its pipeline
+            with send_lock:
+                try:
+                    send_message(self.request, {'transcription': transcription})
+                except OSError:
+                    pass
+
+        channels = params.get('channels', 1)
+        try:
+            pipeline = self.server.open_session(params, on_caption)
+        except Exception as error:
+            send_message(self.request, {'error': repr(error)})
+            return
+        pipeline.start()
+        try:
+            while True:
+                header, payload = recv_message(self.request)
+                if header is None or header.get('stop'):
+                    break
+                samples = np.frombuffer(payload, dtype='<f4')
+                pipeline.feed(samples.reshape(-1, channels) if channels > 1 else samples)
+        finally:
+            pipeline.stop()
+            with send_lock:
+                try:
+                    send_message(self.request, {'transcription': pipeline.transcription, 'final': True})
+                except OSError:
+                    pass
+
+
+def load_model(name, warm_up=True, **load_options):
+    """Loads a whisper model and runs one inference so the first real request doesn't pay for lazy setup"""
+    model = whisper.load_model(name, **load_options)
+    if warm_up:
+        start = time.perf_counter()
+        model.transcribe(np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32), fp16=torch.cuda.is_available())
+        print(f"Warmed up in {round(time.perf_counter() - start, 2)} seconds")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves a resident whisper model over a Unix domain socket.")
+    parser.add_argument("--model", default="base", help="Model to use",
+                        choices=["tiny", "base", "small", "medium", "large"])
+    parser.add_argument("--non_english", action='store_true',
+                        help="Don't use the english model.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Path of the Unix domain socket to listen on.")
+    parser.add_argument("--max_batch", default=1, type=int,
+                        help="Transcriptions of concurrent clients decoded together, 1 serves them one at a time.")
+    parser.add_argument("--deadline", default=0.05, type=float,
+                        help="Seconds a batch waits for more clients after its first request.")
+    args = parser.parse_args()
+
+    # same naming as whispertest.main
+    model = args.model
+    if args.model != "large" and args.non_english:
+        model = model + ".en"
+
+    server = ModelServer(args.socket, load_model(model), args.max_batch, args.deadline)
+    print(f"Serving {model} on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class Telemetry:
+    """Thread safe per-stage timings of the live path.
+
+    Every measurement is kept in a rolling window per metric for percentiles and, if a path is given, appended to a
+    JSON-lines file as it happens. serve() exposes the rolling summary as JSON on a localhost port."""
+
+    def __init__(self, path=None, window=500):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', buffering=1) if path else None
+        self.server = None
+
+    def record(self, metric, value, **fields):
+        """Adds one measurement, seconds for timings and a plain ratio for gauges like the real-time factor"""
+        with self.lock:
+            self.samples[metric].append(value)
+            if self.file:
+                self.file.write(json.dumps(dict(time=time.time(), metric=metric, value=value, **fields)) + '\n')
+
+    def timer(self, metric, **fields):
+        """Context manager that records the wall time of its block"""
+        return _Timer(self, metric, fields)
+
+    def summary(self):
+        with self.lock:
+            samples = {metric: np.array(values) for metric, values in self.samples.items() if values}
+        summary = {}
+        for metric, values in samples.items():
+            summary[metric] = {'count': len(values), 'mean': float(np.mean(values))}
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                summary[metric][f'p{percentile}'] = float(value)
+        return summary
+
+    def report(self):
+        lines = []
+        for metric, stats in sorted(self.summary().items()):
+            percentiles = '  '.join(f"p{p} {stats[f'p{p}']:.3f}" for p in PERCENTILES)
+            lines.append(f"{metric:<16} n {stats['count']:<5} mean {stats['mean']:.3f}  {percentiles}")
+        return '\n'.join(lines)
+
+    def serve(self, port):
+        """Serves the summary at http://127.0.0.1:port/ from a daemon thread"""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(telemetry.summary()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+        if self.file:
+            self.file.close()
+
+
+class _Timer:
+    def __init__(self, telemetry, metric, fields):
+        self.telemetry = telemetry
+        self.metric = metric
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.telemetry.record(self.metric, self.elapsed, **self.fields)
@@ -0,0 +1,236 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("matplotlib")
+
+import complete_radar
+
+RATE = 44100
+SPEED_OF_SOUND = 34314
+MICRO2 = np.array([8, -16])
+MICRO3 = np.array([-8, -16])
+MICROPHONES = np.array([[0, 0], MICRO2, MICRO3])
+SOURCES = [np.array([60, 40]), np.array([-30, 70]), np.array([10, -90]), np.array([-80, -20])]
+
+
+def fractional_delay(audio, delay):
+    n = complete_radar.fft_length(len(audio) + int(np.ceil(abs(delay))) + 1)
+    frequencies = np.fft.rfftfreq(n)
+    return np.fft.irfft(np.fft.rfft(audio, n) * np.exp(-2j * np.pi * frequencies * delay), n)[:len(audio)]
+
+
+def render(source, samples, rng, snr=30):
+    """(samples, 3) microphone signals of white noise played at source, with the exact fractional delays"""
+    audio = rng.normal(size=samples)
+    ranges = np.linalg.norm(source - MICROPHONES, axis=1)
+    sounds = np.stack([fractional_delay(audio, distance * RATE / SPEED_OF_SOUND) for distance in ranges], axis=1)
+    return sounds + rng.normal(0, 10 ** (-snr / 20), sounds.shape)
+
+
+def angle_error(location, source):
+    return np.degrees(np.abs(np.angle(np.exp(1j * (np.arctan2(*location[::-1]) - np.arctan2(*source[::-1]))))))
+
+
+def true_delays(source):
+    # in samples, positive when the other microphone hears the sound first like frame_delays
+    ranges = np.linalg.norm(source - MICROPHONES, axis=1)
+    return (ranges[0] - ranges[1:]) * RATE / SPEED_OF_SOUND
+
+
+def test_radar_frames_matches_radar():
+    rng = np.random.default_rng(0)
+    size_window, hop = 4000, 1500
+    sounds = np.concatenate([render(source, 3 * size_window, rng) for source in SOURCES])
+    times, locations, confidence = complete_radar.radar_frames(MICRO2, MICRO3, sounds, hop, size_window=size_window,
+                                                               local_rate=RATE, sos_local=SPEED_OF_SOUND)
+    assert len(times) == len(locations) == len(confidence) == (len(sounds) - size_window) // hop + 1
+
+    for frame, time in enumerate(times):
+        end = int(round(time * RATE))
+        location = complete_radar.radar(MICRO2, MICRO3, *sounds[:end].T, size_window=size_window, local_rate=RATE,
+                                        sos_local=SPEED_OF_SOUND)
+        if location is None:
+            assert np.isnan(locations[frame]).all()
+        else:
+            np.testing.assert_allclose(locations[frame], location, atol=1e-6)
+
+
+def test_tdoa_least_squares_recovers_source():
+    # a wide array pins down the range as well as the direction, sources far from it take more steps to converge
+    microphones = np.array([[0, 0], [40, 0], [40, 40], [0, 40]])
+    sources = np.array(SOURCES, dtype=float)
+    ranges = np.linalg.norm(sources[:, None] - microphones, axis=2)
+    locations, residual = complete_radar.tdoa_least_squares(microphones, ranges[:, :1] - ranges[:, 1:], max_dist=200,
+                                                            iterations=50)
+    np.testing.assert_allclose(locations, sources, atol=1e-3)
+    assert residual.max() < 1e-6
+
+    # beyond max_dist the direction is kept and the range is pulled in
+    locations, _ = complete_radar.tdoa_least_squares(microphones, ranges[:, :1] - ranges[:, 1:], max_dist=50,
+                                                     iterations=50)
+    for location, source in zip(locations, sources):
+        assert np.linalg.norm(location) == pytest.approx(min(np.linalg.norm(source), 50))
+        assert angle_error(location, source) < 1e-3
+
+    # the three radar microphones only resolve the direction well
+    distances = np.array([true_delays(source) for source in sources]) * SPEED_OF_SOUND / RATE
+    locations, residual = complete_radar.tdoa_least_squares(MICROPHONES, distances, max_dist=200)
+    assert max(angle_error(location, source) for location, source in zip(locations, sources)) < 5
+    assert residual.max() < SPEED_OF_SOUND / RATE / 10  # a tenth of a sample
+
+    # end-fire along the first two microphones, where the delay is the whole spacing and lies on the search bound
+    source = -MICRO2 / np.linalg.norm(MICRO2) * 90
+    location, _ = complete_radar.tdoa_least_squares(MICROPHONES, true_delays(source) * SPEED_OF_SOUND / RATE,
+                                                    max_dist=200)
+    assert angle_error(location[0], source) < 5
+    sounds = render(source, 5000, np.random.default_rng(3))
+    _, locations, _, _ = complete_radar.radar_array(MICROPHONES, sounds, 5000, max_dist=200, local_rate=RATE,
+                                                    sos_local=SPEED_OF_SOUND)
+    assert angle_error(locations[0], source) < 5
+
+
+def test_radar_least_squares_finds_direction():
+    rng = np.random.default_rng(1)
+    for source in SOURCES:
+        sounds = render(source, 5000, rng)
+        location = complete_radar.radar(MICRO2, MICRO3, *sounds.T, max_dist=200, local_rate=RATE,
+                                        sos_local=SPEED_OF_SOUND, solver='least_squares')
+        assert angle_error(location, source) < 5
+
+
+def test_narrow_delays_matches_frame_delays():
+    rng = np.random.default_rng(2)
+    max_delay = complete_radar.find_max_delay(MICRO2, MICRO3, RATE, SPEED_OF_SOUND)
+    for source in SOURCES:
+        frames = render(source, 5000, rng).T
+        delays, _ = complete_radar.frame_delays(frames, max_delay)
+        np.testing.assert_allclose(delays, true_delays(source), atol=0.2)
+
+        # a guess a few samples off still finds the same peak
+        for offset in (0, -2, 3):
+            narrow, peaks = complete_radar.narrow_delays(frames, delays + offset, 4, max_delay)
+            np.testing.assert_allclose(narrow, delays, atol=0.2)
+            assert peaks.min() > 0.5
+
+        # a guess too far away doesn't reach the peak, which the low correlation shows
+        far = np.where(delays > 0, delays - 12, delays + 12)
+        _, peaks = complete_radar.narrow_delays(frames, far, 2, max_delay)
+        assert peaks.max() < 0.2
+
+
+def test_radar_tracker_follows_a_moving_talker():
+    rng = np.random.default_rng(4)
+    # a steady talker, so a jump across the array is far outside the gate
+    tracker = complete_radar.RadarTracker(MICRO2, MICRO3, size_window=2000, local_rate=RATE, sos_local=SPEED_OF_SOUND,
+                                          solver='least_squares', process_noise=200.)
+    length = tracker.size_window + 2 * tracker.max_delay
+
+    # a talker walking around the array at 60 cm, a quarter second between windows
+    searches, errors = [], []
+    for step in range(20):
+        angle = 0.5 + 0.02 * step
+        source = 60 * np.array([np.cos(angle), np.sin(angle)])
+        location = tracker.update(*render(source, length, rng).T, dt=0.25)
+        searches.append(tracker.full_search)
+        errors.append(angle_error(location, source))
+    # the first window has no prediction, after it the narrow search keeps the track
+    assert searches[0] and not any(searches[1:])
+    assert np.median(errors) < 3
+
+    # a jump to the other side is outside the narrow search, the full search finds it and starts over
+    source = -source
+    location = tracker.update(*render(source, length, rng).T, dt=0.25)
+    assert tracker.full_search
+    assert angle_error(location, source) < 5
+    np.testing.assert_array_equal(tracker.state[2:], 0)
+
+
+def test_radar_tracker_drops_the_track():
+    rng = np.random.default_rng(5)
+    tracker = complete_radar.RadarTracker(MICRO2, MICRO3, size_window=2000, local_rate=RATE, sos_local=SPEED_OF_SOUND,
+                                          patience=3)
+    length = tracker.size_window + 2 * tracker.max_delay
+    source = np.array([-30, -52])
+    location = tracker.update(*render(source, length, rng).T, dt=0.25)
+    assert angle_error(location, source) < 5
+
+    # delays no source can cause, the tracker keeps its prediction until patience runs out
+    for miss in range(1, 4):
+        audio = rng.normal(size=length)
+        location = tracker.update(audio, fractional_delay(audio, 20), fractional_delay(audio, -20), dt=0.25)
+        assert tracker.full_search
+        if miss < 3:
+            assert tracker.misses == miss
+            assert angle_error(location, source) < 5
+        else:
+            assert location is None and tracker.state is None
+
+
+def test_delay_table_must_match_the_rate():
+    table = complete_radar.build_delay_table(MICRO2, MICRO3, local_rate=RATE, sos_local=SPEED_OF_SOUND)
+    sounds = render(SOURCES[2], 5000, np.random.default_rng(6)).T
+    assert complete_radar.radar(MICRO2, MICRO3, *sounds, local_rate=RATE, sos_local=SPEED_OF_SOUND,
+                                table=table) is not None
+    with pytest.raises(ValueError):
+        complete_radar.radar(MICRO2, MICRO3, *sounds, local_rate=16000, sos_local=SPEED_OF_SOUND, table=table)
+    with pytest.raises(ValueError):
+        complete_radar.RadarTracker(MICRO2, MICRO3, local_rate=16000, sos_local=SPEED_OF_SOUND, table=table)
+
+
+def test_lookup_location():
+    table = complete_radar.build_delay_table(MICRO2, MICRO3, local_rate=RATE, sos_local=SPEED_OF_SOUND)
+    max_delay = complete_radar.find_max_delay(MICRO2, MICRO3, RATE, SPEED_OF_SOUND)
+    lags = np.arange(-max_delay + 1, max_delay)
+    assert len(table) == len(lags)
+
+    # exact at the integer delays, the table entry or None where it has no location
+    for i, delay2 in enumerate(lags):
+        for j, delay3 in enumerate(lags):
+            location = complete_radar.lookup_location(table, delay2, delay3)
+            if np.isnan(table[i, j]).any():
+                assert location is None
+            else:
+                np.testing.assert_array_equal(location, table[i, j])
+
+    # between close entries the location is interpolated, between entries on different branches the nearest is used
+    interpolated = jumps = 0
+    for i in range(len(lags) - 1):
+        for j in range(len(lags) - 1):
+            corners = table[i:i + 2, j:j + 2].reshape(-1, 2)
+            if not np.isfinite(corners).all():
+                continue
+            spread = np.linalg.norm(corners[:, None] - corners[None], axis=2).max()
+            location = complete_radar.lookup_location(table, lags[i] + 0.4, lags[j] + 0.4)
+            if spread <= 0.5 * np.linalg.norm(corners, axis=1).max():
+                interpolated += 1
+                np.testing.assert_allclose(location, 0.36 * corners[0] + 0.24 * corners[1] + 0.24 * corners[2]
+                                           + 0.16 * corners[3])
+            else:
+                jumps += 1
+                np.testing.assert_array_equal(location, table[i, j])
+    assert interpolated and jumps
+
+
+def test_srp_peaks_suppresses_neighbors():
+    grid = complete_radar.srp_grid(MICROPHONES, local_rate=RATE, sos_local=SPEED_OF_SOUND, angles=72, radii=6)
+    power = np.zeros((6, 72))
+    power[2, 10], power[4, 11], power[1, 40] = 0.9, 0.8, 0.6
+    # neighbors across the wrap around of the directions are suppressed too
+    power[3, 0], power[3, 71] = 0.7, 0.65
+
+    locations, powers = complete_radar.srp_peaks(power, grid, k=3)
+    np.testing.assert_array_equal(powers, [0.9, 0.7, 0.6])
+    np.testing.assert_array_equal(locations, grid['points'][[2, 3, 1], [10, 0, 40]])
+    assert len(complete_radar.srp_peaks(power, grid, k=1)[0]) == 1
+
+
+def test_radar_sources_finds_two_talkers():
+    rng = np.random.default_rng(7)
+    sources = [np.array([60, 40]), np.array([-30, -70])]
+    # the second talker is 2 dB quieter, so it comes second, much quieter ones are lost in the first one's sidelobes
+    sounds = render(sources[0], 5000, rng) + 0.8 * render(sources[1], 5000, rng)
+    locations, powers = complete_radar.radar_sources(MICRO2, MICRO3, *sounds.T, max_dist=200, local_rate=RATE,
+                                                     sos_local=SPEED_OF_SOUND)
+    assert len(locations) == 2 and powers[0] >= powers[1] > 0.1
+    for location, source in zip(locations, sources):
+        assert angle_error(location, source) < 5
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("whisper")
+
+from cpu_inference import TEMPERATURES, decode_options, first_pass_options
+
+
+@pytest.mark.parametrize("policy", ['greedy', 'beam'])
+@pytest.mark.parametrize("max_fallbacks", [None, 0, 2])
+def test_first_pass_options_are_valid_decoding_options(policy, max_fallbacks):
+    options = first_pass_options(dict(decode_options(policy, max_fallbacks), fp16=False))
+    assert options['temperature'] == 0.0
+    assert options['fp16'] is False
+    # decode refuses best_of at temperature 0 and together with beam_size
+    assert 'best_of' not in options
+    if policy == 'beam':
+        assert options['beam_size'] == 2
+
+
+def test_first_pass_options_sampling():
+    options = first_pass_options({'temperature': TEMPERATURES[2:], 'beam_size': 2, 'best_of': 2})
+    assert options == {'temperature': TEMPERATURES[2], 'best_of': 2}
+    assert first_pass_options({'temperature': 0.4, 'beam_size': 2}) == {'temperature': 0.4}
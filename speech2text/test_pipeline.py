@@ -0,0 +1,174 @@
+import threading
+import time
+from queue import Queue
+
+import numpy as np
+import pytest
+
+pytest.importorskip("soundfile")
+pytest.importorskip("pydub")
+
+from incremental import IncrementalTranscriber
+from pipeline import PHRASE_PIECE, LivePipeline, WindowTranscriber, drain, put_latest
+
+RATE = 100
+CHUNK = 10  # samples per chunk, every chunk holds its own number so the text shows which audio was decoded
+
+
+def chunk(number):
+    return np.full(CHUNK, number, dtype=np.float32)
+
+
+def numbers(audio):
+    """The chunk numbers in audio, in order"""
+    return [int(value) for value in audio[np.r_[True, audio[1:] != audio[:-1]]]] if len(audio) else []
+
+
+class NumberModel:
+    """Stand-in for whisper, transcribes every chunk as its number with word timestamps"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio, **options):
+        self.calls += 1
+        words, start = [], 0
+        for number in numbers(audio):
+            end = start + CHUNK
+            # a new suffix every call, so consecutive hypotheses never agree and nothing is committed by update()
+            words.append({'word': f" {number}.{self.calls}", 'start': start / RATE, 'end': end / RATE})
+            start = end
+        return {'text': ''.join(word['word'] for word in words), 'segments': [{'words': words}]}
+
+
+class BlockingTranscriber(WindowTranscriber):
+    """WindowTranscriber whose first update waits for `release`, so the chunks fed meanwhile queue up"""
+
+    def __init__(self, buffer):
+        super().__init__(None, buffer)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+        self.started.set()
+        self.release.wait(5)
+        return ' '.join(map(str, numbers(self.buffer.view())))
+
+
+def make_pipeline(make_transcriber, window=1.0, phrase_timeout=1.0, **kwargs):
+    captions = []
+    pipeline = LivePipeline(make_transcriber, sample_rate=RATE, window=window, chunk_duration=CHUNK / RATE,
+                            phrase_timeout=phrase_timeout, on_caption=lambda lines: captions.append(list(lines)),
+                            **kwargs)
+    pipeline.start()
+    return pipeline, captions
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "the pipeline didn't get there in time"
+        time.sleep(0.001)
+
+
+def stop(pipeline):
+    pipeline.stop()
+    assert not any(thread.is_alive() for thread in pipeline.threads)
+
+
+def test_put_latest_drops_the_oldest():
+    queue = Queue(maxsize=2)
+    for item in range(5):
+        put_latest(queue, item)
+    assert drain(queue, queue.get()) == [3, 4]
+
+
+def test_asr_coalesces_the_chunks_queued_during_a_decode():
+    transcribers = []
+    pipeline, captions = make_pipeline(lambda buffer: transcribers.append(BlockingTranscriber(buffer)) or
+                                       transcribers[-1])
+    pipeline.feed(chunk(1), captured_at=0.1)
+    wait_for(lambda: transcribers and transcribers[0].started.is_set())
+
+    # while the first decode runs, more than a window arrives and the ASR queue keeps the newest chunks
+    for number in range(2, 31):
+        pipeline.feed(chunk(number), captured_at=number / 10)
+    wait_for(lambda: pipeline.asr_queue.full() and pipeline.asr_queue.queue[-1].samples[0] == 30)
+    transcribers[0].release.set()
+    stop(pipeline)
+
+    # one decode for everything that queued up, of the newest window of it
+    assert transcribers[0].updates == 2
+    assert captions[-1] == [' '.join(map(str, range(21, 31)))]
+
+
+def test_phrase_boundary_across_dropped_chunks():
+    transcribers = []
+    pipeline, captions = make_pipeline(lambda buffer: transcribers.append(BlockingTranscriber(buffer)) or
+                                       transcribers[-1])
+    pipeline.feed(chunk(1), captured_at=0.1)
+    wait_for(lambda: transcribers and transcribers[0].started.is_set())
+
+    # the start of the first phrase's queued chunks is dropped, the pause to the second phrase survives in them
+    for number in range(2, 21):
+        pipeline.feed(chunk(number), captured_at=number / 10)
+    for number in range(21, 26):
+        pipeline.feed(chunk(number), captured_at=5 + number / 10)
+    wait_for(lambda: pipeline.asr_queue.full() and pipeline.asr_queue.queue[-1].samples[0] == 25)
+    transcribers[0].release.set()
+    stop(pipeline)
+
+    assert captions[0] == ['1']
+    assert captions[-1] == ['1 15 16 17 18 19 20', '21 22 23 24 25']
+
+
+def test_incremental_commits_before_the_window_overflows():
+    model = NumberModel()
+    pipeline, captions = make_pipeline(lambda buffer: IncrementalTranscriber(model, buffer))
+
+    # four windows of one phrase, fed one chunk at a time so the queues drop nothing
+    for number in range(1, 41):
+        pipeline.feed(chunk(number), captured_at=number / 10)
+        wait_for(lambda: pipeline.capture_queue.empty() and pipeline.asr_queue.empty())
+    stop(pipeline)
+
+    # the hypotheses never agree, every word still reaches the caption through make_room
+    assert len(captions[-1]) == 1
+    assert [int(word.split('.')[0]) for word in captions[-1][0].split()] == list(range(1, 41))
+
+
+class Partials:
+    def __init__(self):
+        self.heard = 0
+
+    def reset(self):
+        self.heard = 0
+
+    def update(self, samples):
+        self.heard += len(samples)
+        return f"{self.heard} samples"
+
+
+def test_tiered_decodes_a_long_phrase_in_pieces():
+    transcribers = []
+
+    def make_transcriber(buffer):
+        transcribers.append(WindowTranscriber(NumberModel(), buffer))
+        return transcribers[-1]
+
+    pipeline, captions = make_pipeline(make_transcriber, window=3.0, partials=Partials())
+    seconds = 70
+    for number in range(1, seconds * RATE // CHUNK + 1):
+        pipeline.feed(chunk(number), captured_at=number / 10)
+        wait_for(lambda: pipeline.capture_queue.empty() and pipeline.asr_queue.empty())
+    stop(pipeline)
+
+    # the whole phrase is decoded once it ends, in pieces of PHRASE_PIECE seconds, and replaces the provisional text
+    assert transcribers[0].model.calls == -(-seconds // PHRASE_PIECE)
+    assert any(lines[0].endswith('samples') for lines in captions)
+    assert captions[-1] == [''.join(f" {number}.{call}" for call, numbers_ in
+                                    enumerate(np.array_split(np.arange(1, 701), [300, 600]), 1)
+                                    for number in numbers_).strip()]
+    assert pipeline.transcription == captions[-1]
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("soundfile")
+pytest.importorskip("pydub")
+
+from process import SilenceDetector, silence_boundaries
+from ring_buffer import RingBuffer
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=0.5, frequency=440):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.cos(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.float32)
+
+
+def test_silence_boundaries():
+    audio = np.concatenate((silence(0.25), tone(0.5), silence(0.25), tone(0.1), silence(0.5)))
+    start, end = silence_boundaries(audio, 0.01, cons=int(0.2 * RATE))
+    assert start == int(0.25 * RATE)
+    # the first silence long enough ends the sound, a few samples early where the tone crosses zero
+    assert abs(end - int(0.75 * RATE)) < 10
+
+
+def test_silence_boundaries_short_pauses_and_channels():
+    audio = np.concatenate((silence(0.1), tone(0.3), silence(0.05), tone(0.3), silence(0.2)))
+    start, end = silence_boundaries(audio, 0.01, cons=int(0.1 * RATE))
+    assert start == int(0.1 * RATE)
+    assert abs(end - int(0.75 * RATE)) < 10
+
+    # the loudest channel decides
+    stereo = np.stack((np.zeros_like(audio), audio), axis=1)
+    assert silence_boundaries(stereo, 0.01, cons=int(0.1 * RATE)) == (start, end)
+
+
+def test_silence_boundaries_all_silent():
+    audio = silence(0.5)
+    assert silence_boundaries(audio, 0.01) == (len(audio), len(audio))
+
+
+def test_silence_detector_endpoint():
+    buffer = RingBuffer(2 * RATE, RATE)
+    detector = SilenceDetector(buffer, 0.01, block_duration=0.01, min_silence=0.3)
+
+    def feed(audio, chunk=0.1):
+        size = int(chunk * RATE)
+        for start in range(0, len(audio), size):
+            buffer.write(audio[start:start + size])
+            detector.update()
+
+    feed(silence(0.2))
+    assert detector.boundaries() == (0, 0)
+    assert not detector.endpoint()
+
+    feed(tone(0.5))
+    start, end = detector.boundaries()
+    assert start == int(0.2 * RATE)
+    assert end == int(0.7 * RATE)
+    assert not detector.endpoint()
+
+    # a pause shorter than min_silence doesn't end the sound
+    feed(silence(0.2))
+    assert not detector.endpoint()
+    feed(silence(0.1))
+    assert detector.endpoint()
+
+    # the boundaries follow the buffer when its start is discarded
+    buffer.discard(int(0.3 * RATE))
+    assert detector.boundaries() == (0, int(0.4 * RATE))
+    assert detector.endpoint()
+
+
+def test_silence_detector_overwritten_audio():
+    buffer = RingBuffer(RATE, RATE)
+    detector = SilenceDetector(buffer, 0.01, min_silence=0.3)
+
+    # the tone is pushed out of the buffer by a single long write
+    buffer.write(tone(0.5))
+    detector.update()
+    buffer.write(silence(1.5))
+    detector.update()
+    assert detector.boundaries() == (0, 0)
+    assert not detector.endpoint()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from ring_buffer import RingBuffer
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+def test_view_is_the_tail_of_the_stream(channels):
+    rng = np.random.default_rng(0)
+    capacity = 100
+    buffer = RingBuffer(capacity, channels=channels)
+    stream = np.zeros((0,) if channels == 1 else (0, channels), dtype=np.float32)
+
+    # chunks shorter and longer than the buffer, so writes wrap around and overwrite all of it
+    for _ in range(200):
+        n = int(rng.integers(0, 2 * capacity + 10))
+        chunk = rng.normal(size=(n,) if channels == 1 else (n, channels)).astype(np.float32)
+        buffer.write(chunk)
+        stream = np.concatenate((stream, chunk))
+
+        tail = stream[-capacity:]
+        assert buffer.total == len(stream)
+        assert len(buffer) == len(tail)
+        assert buffer.start == len(stream) - len(tail)
+        np.testing.assert_array_equal(buffer.view(), tail)
+        n = int(rng.integers(0, capacity + 10))
+        np.testing.assert_array_equal(buffer.view(n), tail[len(tail) - min(n, len(tail)):])
+        if channels > 1:
+            np.testing.assert_array_equal(buffer.view()[:, 1], tail[:, 1])
+
+
+def test_discard_drops_the_oldest_samples():
+    rng = np.random.default_rng(1)
+    buffer = RingBuffer(50)
+    stream = rng.normal(size=130).astype(np.float32)
+    for start in range(0, len(stream), 17):
+        buffer.write(stream[start:start + 17])
+
+    buffer.discard(20)
+    assert len(buffer) == 30
+    assert buffer.start == len(stream) - 30
+    np.testing.assert_array_equal(buffer.view(), stream[-30:])
+
+    # new samples after a discard continue the stream
+    more = rng.normal(size=10).astype(np.float32)
+    buffer.write(more)
+    np.testing.assert_array_equal(buffer.view(), np.concatenate((stream, more))[-40:])
+
+    buffer.discard(100)
+    assert len(buffer) == 0
+    assert len(buffer.view()) == 0
+    buffer.write(more)
+    np.testing.assert_array_equal(buffer.view(), more)
+
+
+def test_clear():
+    buffer = RingBuffer(10)
+    buffer.write(np.ones(15))
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.total == 15
+    buffer.write(np.arange(3))
+    np.testing.assert_array_equal(buffer.view(), np.arange(3, dtype=np.float32))
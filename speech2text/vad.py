@@ -0,0 +1,69 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def frame_features(samples, frame_length=400, hop_length=160):
+    """Vectorized per-frame energy (dB), zero-crossing rate and spectral flatness of a chunk
+    input:
+        samples (np.array): mono float samples
+        frame_length (int): samples per frame, 25 ms at 16 kHz
+        hop_length (int): samples between frames, 10 ms at 16 kHz
+    output:
+        energy (np.array): mean frame power in dB
+        zcr (np.array): fraction of sign changes per sample
+        flatness (np.array): geometric over arithmetic mean of the power spectrum, near 0 for tonal or voiced
+            frames and near 1 for white noise"""
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    frames = sliding_window_view(samples, frame_length)[::hop_length]
+
+    energy = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+
+    power = np.abs(np.fft.rfft(frames * np.hamming(frame_length), axis=1)) ** 2 + 1e-10
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return energy, zcr, flatness
+
+
+class VoiceActivityDetector:
+    """Cheap speech/non-speech gate for audio chunks, meant to run before ASR.
+
+    A frame counts as speech when its energy is `margin` dB above the adaptive noise floor, its spectrum is not
+    noise-like (flatness) and it is not dominated by hiss (zero-crossing rate). The noise floor follows the quietest
+    frames of each chunk: it drops immediately and rises slowly, so speech can't drag it up. A chunk is speech
+    when enough of its frames are, and `hangover` chunks after speech are let through so phrase endings reach ASR."""
+
+    def __init__(self, sample_rate=16000, margin=10.0, max_flatness=0.45, max_zcr=0.35, min_speech_frames=0.1,
+                 floor_rise=0.05, hangover=1):
+        self.frame_length = int(0.025 * sample_rate)
+        self.hop_length = int(0.010 * sample_rate)
+        self.margin = margin
+        self.max_flatness = max_flatness
+        self.max_zcr = max_zcr
+        self.min_speech_frames = min_speech_frames
+        self.floor_rise = floor_rise
+        self.hangover = hangover
+        self.noise_floor = None
+        self._hangover_left = 0
+
+    def speech_frames(self, samples):
+        energy, zcr, flatness = frame_features(np.asarray(samples, dtype=np.float32), self.frame_length,
+                                               self.hop_length)
+
+        quiet = np.percentile(energy, 10)
+        if self.noise_floor is None or quiet < self.noise_floor:
+            self.noise_floor = quiet
+        else:
+            self.noise_floor += self.floor_rise * (quiet - self.noise_floor)
+
+        return (energy > self.noise_floor + self.margin) & (flatness < self.max_flatness) & (zcr < self.max_zcr)
+
+    def __call__(self, samples):
+        """Returns whether the chunk should be transcribed"""
+        if np.mean(self.speech_frames(samples)) >= self.min_speech_frames:
+            self._hangover_left = self.hangover
+            return True
+        if self._hangover_left > 0:
+            self._hangover_left -= 1
+            return True
+        return False
@@ -3,20 +3,25 @@ import time
 from pocketsphinx import LiveSpeech
 
 import argparse
-import io
 import os
 import speech_recognition as sr
 import whisper
 import torch
 
-from datetime import datetime, timedelta
-from queue import Queue
-from tempfile import NamedTemporaryFile
-from time import sleep
 from sys import platform
 
 from display import *
 from process import *
+from incremental import IncrementalTranscriber
+from mel_cache import MelTranscriber
+from partials import SphinxPartials
+from pipeline import LivePipeline, WindowTranscriber
+from server import RemoteModel, RemoteSession
+from telemetry import Telemetry
+from replay import ReplaySource, expand_paths
+from vad import VoiceActivityDetector
+from adaptive import LADDER, AdaptiveModel
+from cpu_inference import CPU_MAX_FALLBACKS, BudgetedModel, decode_options, load_cpu_model
 import complete_radar
 
 
@@ -34,21 +39,85 @@ def main():
     parser.add_argument("--phrase_timeout", default=2,
                         help="How much empty space between recordings before we "
                              "consider it a new line in the transcription.", type=float)
+    parser.add_argument("--vad", action='store_true',
+                        help="Only transcribe chunks that the voice activity detector classifies as speech.")
+    parser.add_argument("--endpoint", action='store_true',
+                        help="End a phrase once the audio stays below the energy threshold for phrase_timeout "
+                             "seconds, also for sources that send audio without pauses.")
+    parser.add_argument("--window", default=3,
+                        help="How many seconds of the current phrase are kept for transcription.", type=float)
+    parser.add_argument("--incremental", action='store_true',
+                        help="Commit text once it is stable and only re-transcribe the uncommitted audio.")
+    parser.add_argument("--tiered", action='store_true',
+                        help="Show provisional pocketsphinx captions right away and replace them with Whisper's "
+                             "text once each phrase ends.")
+    parser.add_argument("--mel_cache", action='store_true',
+                        help="Keep the log-mel frames of the window between updates and decode them directly.")
+    parser.add_argument("--adaptive", action='store_true',
+                        help="Preload --model and the smaller models after it and switch between them to keep "
+                             "the decode time within --latency_budget.")
+    parser.add_argument("--latency_budget", default=1.0,
+                        help="Seconds a transcription may take in the adaptive mode.", type=float)
+    parser.add_argument("--server", default=None,
+                        help="Socket of a running server.py to use instead of loading a model here.", type=str)
+    parser.add_argument("--session", action='store_true',
+                        help="Stream the audio to the --server and let it run the pipeline, so one server process "
+                             "can transcribe many streams.")
+    parser.add_argument("--cpu", action='store_true',
+                        help="Run the model on CPU with int8 dynamically quantized linear layers.")
+    parser.add_argument("--threads", default=None,
+                        help="Intra-op threads for CPU inference.", type=int)
+    parser.add_argument("--decode", default="greedy", choices=["greedy", "beam"],
+                        help="Decoding policy, greedy is whisper's default and beam searches 2 hypotheses.")
+    parser.add_argument("--max_fallbacks", default=None,
+                        help=f"Cap on the temperature fallback passes per chunk, {CPU_MAX_FALLBACKS} with --cpu and "
+                             f"all of them otherwise.", type=int)
+    parser.add_argument("--budget", default=None,
+                        help="Seconds per transcription, fallbacks are skipped when they would not fit.", type=float)
+    parser.add_argument("--telemetry", default=None,
+                        help="JSON-lines file that receives every per-stage timing.", type=str)
+    parser.add_argument("--telemetry_port", default=None,
+                        help="Serve rolling timing percentiles as JSON on this localhost port.", type=int)
+    parser.add_argument("--channels", default=1,
+                        help="Microphones to capture together, with 3 the radar gets one real signal per "
+                             "microphone.", type=int)
+    parser.add_argument("--track", action='store_true',
+                        help="Follow the speaker from one radar window to the next, searching only the delays "
+                             "near the last location and smoothing it.")
+    parser.add_argument("--device", default=None,
+                        help="Input device name or index for multichannel capture.", type=str)
+    parser.add_argument("--replay", nargs='+', default=None,
+                        help="WAV files or glob patterns to replay instead of listening to a microphone.")
+    parser.add_argument("--replay_speed", default=1.0,
+                        help="Replay pace as a multiple of real time.", type=float)
+    parser.add_argument("--visualize", action='store_true',
+                        help="Show a live waveform and spectrogram, drawn by a separate process.")
     if 'linux' in platform:
         parser.add_argument("--default_microphone", default='pulse',
                             help="Default microphone name for SpeechRecognition. "
                                  "Run this with 'list' to view available Microphones.", type=str)
     args = parser.parse_args()
+    if args.mel_cache and args.server:
+        parser.error("--mel_cache needs the model in this process, it can't be combined with --server")
+    # the cached features go straight to whisper.decode, past the model wrappers and the other transcribers
+    for flag in ('budget', 'adaptive', 'incremental'):
+        if args.mel_cache and getattr(args, flag):
+            parser.error(f"--mel_cache decodes with the bare model, it can't be combined with --{flag}")
+    if args.session and not args.server:
+        parser.error("--session needs the --server to stream to")
+    # a session runs the server's pipeline, which has no radar, partials or model wrappers, and reports no timings
+    for flag in ('track', 'tiered', 'incremental', 'budget', 'endpoint', 'telemetry', 'telemetry_port'):
+        if args.session and getattr(args, flag):
+            parser.error(f"--session runs the pipeline on the server, it can't be combined with --{flag}")
+    for flag in ('cpu', 'threads'):
+        if args.server and getattr(args, flag):
+            parser.error(f"--server transcribes with the server's model, it can't be combined with --{flag}")
+    if args.adaptive and args.server:
+        parser.error("--adaptive switches between models in this process, it can't be combined with --server")
 
 
 
     # initialize microphone objects ---------------------------------------------------------------
-    # The last time a recording was retrieved from the queue.
-    phrase_time = None
-    # Current raw audio bytes.
-    last_sample = bytes()
-    # Thread safe Queue for passing data from the threaded recording callback.
-    data_queue = Queue()
     # We use SpeechRecognizer to record our audio because it has a nice feature where it can detect when speech ends.
     recorder = sr.Recognizer()
     recorder.energy_threshold = args.energy_threshold
@@ -58,7 +127,18 @@ def main():
 
     # Important for linux users.
     # Prevents permanent application hang and crash by using the wrong Microphone
-    if 'linux' in platform:
+    if args.replay:
+        source = ReplaySource(expand_paths(args.replay), speed=args.replay_speed, gap=1.5 * args.phrase_timeout,
+                              channels=args.channels)
+    elif args.channels > 1:
+        # sounddevice needs PortAudio, which the single microphone path doesn't
+        from capture import MultichannelMicrophone
+        if args.device == 'list':
+            print("Available input devices are: ", MultichannelMicrophone.list_devices())
+            return
+        device = int(args.device) if args.device and args.device.isdigit() else args.device
+        source = MultichannelMicrophone(device, args.channels)
+    elif 'linux' in platform:
         mic_name = args.default_microphone
         if not mic_name or mic_name == 'list':
             print("Available microphone devices are: ")
@@ -77,37 +157,105 @@ def main():
 
 
     # Load / Download model -----------------------------------------------------------------------
-    model = args.model
-    # TODO reinsert not english
-    if args.model != "large" and args.non_english:
-        model = model + ".en"
-    audio_model = whisper.load_model(model)
-
-    record_timeout = args.record_timeout
-    phrase_timeout = args.phrase_timeout
+    telemetry = Telemetry(args.telemetry)
+    if args.telemetry_port:
+        telemetry.serve(args.telemetry_port)
+
+    def load(name):
+        # TODO reinsert not english
+        if name != "large" and args.non_english:
+            name = name + ".en"
+        return load_cpu_model(name, args.threads) if args.cpu else whisper.load_model(name)
+
+    if args.session:
+        audio_model = None  # the server's model transcribes this stream
+    elif args.server:
+        audio_model = RemoteModel(args.server)
+    elif args.adaptive:
+        # every rung is loaded up front so switching never waits for a download
+        ladder = LADDER[LADDER.index(args.model):] if args.model in LADDER else (args.model,) + LADDER
+        audio_model = AdaptiveModel([(name, load(name)) for name in ladder], args.latency_budget,
+                                    backlog=lambda: pipeline.asr_queue.qsize(), telemetry=telemetry)
+    else:
+        audio_model = load(args.model)
+    if args.budget and audio_model is not None:
+        audio_model = BudgetedModel(audio_model, args.budget)
+
+    # on CPU every fallback pass is another full decode, so the CPU mode caps them unless asked otherwise
+    max_fallbacks = CPU_MAX_FALLBACKS if args.cpu and args.max_fallbacks is None else args.max_fallbacks
+    transcribe_options = decode_options(args.decode, max_fallbacks)
+    transcribe_options['fp16'] = torch.cuda.is_available() and not args.cpu
+
+    def make_transcriber(speech_window):
+        # The newest audio of the current phrase, the transcriber reads views of it instead of files.
+        if args.incremental:
+            return IncrementalTranscriber(audio_model, speech_window, **transcribe_options)
+        if args.mel_cache:
+            return MelTranscriber(audio_model, speech_window, **transcribe_options)
+        return WindowTranscriber(audio_model, speech_window, **transcribe_options)
+
+    # RADAR PATCH
+    m2 = np.array([8, -16])
+    m3 = np.array([-8, -16])
+    # the least squares fit keeps a location all around the glasses, triangulate loses sources behind them
+    tracker = complete_radar.RadarTracker(m2, m3, local_rate=source.SAMPLE_RATE,
+                                          solver='least_squares') if args.track else None
+
+    def locate(audio_array):
+        # the channels of the interleaved capture window are strided views, a single microphone stands in for all
+        sounds = audio_array.T if audio_array.ndim > 1 else (audio_array,) * 3
+        if tracker is not None:
+            return tracker.update(sounds[0], sounds[1], sounds[2])
+        return complete_radar.radar(micro2=m2, micro3=m3, sound1=sounds[0], sound2=sounds[1], sound3=sounds[2],
+                                    local_rate=source.SAMPLE_RATE)
+
+    # the pipeline measures pauses in wall time, which an accelerated replay compresses
+    phrase_timeout = args.phrase_timeout / args.replay_speed if args.replay else args.phrase_timeout
+    if args.session:
+        print("The session transcribes on the server, speaker locations are only found by the local pipeline.")
+        pipeline = RemoteSession(args.server, sample_rate=source.SAMPLE_RATE, window=args.window,
+                                 chunk_duration=args.record_timeout, phrase_timeout=phrase_timeout,
+                                 channels=args.channels, vad=args.vad, options=transcribe_options)
+    else:
+        pipeline = LivePipeline(make_transcriber, sample_rate=source.SAMPLE_RATE, window=args.window,
+                                chunk_duration=args.record_timeout, phrase_timeout=phrase_timeout, locate=locate,
+                                detector=VoiceActivityDetector(source.SAMPLE_RATE) if args.vad else None,
+                                telemetry=telemetry, channels=args.channels,
+                                silence_threshold=args.energy_threshold / 32768 if args.endpoint else None,
+                                min_silence=args.phrase_timeout,
+                                partials=SphinxPartials(source.SAMPLE_RATE) if args.tiered else None)
 
-    temp_file = NamedTemporaryFile().name
-    transcription = ['']
+    visualizer = LiveVisualizer(source.SAMPLE_RATE) if args.visualize else None
 
-    with source:
-        recorder.adjust_for_ambient_noise(source)
+    if isinstance(source, sr.Microphone):
+        with source:
+            recorder.adjust_for_ambient_noise(source)
 
 
 
 
     # Listening ----------------------------------------------------------------------------------
-    def record_callback(_, audio: sr.AudioData) -> None:
+    def record_callback(_, audio) -> None:
         """
         Threaded callback function to receive audio data when recordings finish.
-        audio: An AudioData containing the recorded bytes.
+        audio: An AudioData containing the recorded bytes, or float32 frames from a multichannel source.
         """
-        # Grab the raw bytes and push it into the thread safe queue.
-        data = audio.get_raw_data()
-        data_queue.put(data)
+        # Grab the raw bytes and push them into the capture stage.
+        if isinstance(audio, sr.AudioData):
+            audio = pcm_to_float32(audio.get_raw_data(), source.SAMPLE_WIDTH)
+        pipeline.feed(audio)
+        if visualizer is not None:
+            visualizer.push(audio.mean(axis=1) if audio.ndim > 1 else audio)
 
     # Create a background thread that will pass us raw audio bytes.
     # We could do this manually but SpeechRecognizer provides a nice helper.
-    recorder.listen_in_background(source, record_callback, phrase_time_limit=record_timeout)
+    pipeline.start()
+    if visualizer is not None:
+        visualizer.start()
+    if isinstance(source, sr.Microphone):
+        stop_listening = recorder.listen_in_background(source, record_callback, phrase_time_limit=args.record_timeout)
+    else:
+        stop_listening = source.listen_in_background(record_callback, phrase_time_limit=args.record_timeout)
 
     # Cue the user that we're ready to go.
     print("Model loaded.\n")
@@ -116,93 +264,28 @@ def main():
 
 
     # Main loop ----------------------------------------------------------------------------------
-    while True:
-        start = time.perf_counter()
-        try:
-            now = datetime.utcnow()
-            # Pull raw recorded audio from the queue.
-            if not data_queue.empty():
-                phrase_complete = False
-                # If enough time has passed between recordings, consider the phrase complete.
-                # Clear the current working audio buffer to start over with the new data.
-                if phrase_time and now - phrase_time > timedelta(seconds=phrase_timeout):
-                    last_sample = bytes()
-                    phrase_complete = True
-                # This is the last time we received new audio data from the queue.
-                phrase_time = now
-
-                # Concatenate our current audio data with the latest audio data.
-                while not data_queue.empty():
-                    data = data_queue.get()
-                    last_sample += data
-
-                # Use AudioData to convert the raw data to wav data.
-                audio_data = sr.AudioData(last_sample, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
-                wav_data = io.BytesIO(audio_data.get_wav_data())
-
-                # Write wav data to the temporary file as bytes.
-                with open(temp_file, 'w+b') as f:
-                    f.write(wav_data.read())
-
-
-
-
-                """  %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%  INSERTED CODE START  %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%% """
-
-                speech_window = 'rolling_audio.wav'
-                print(get_audio_duration(temp_file))
-                # visualize_audio(temp_file)
-                # start_dur, end_dur = remove_silence(temp_file, 0.02)
-                # print("Start duration: ", start_dur, "-- End duration: ", end_dur)
-                # visualize_audio(temp_file)
-
-                append_to_wav(speech_window, temp_file)
-                # play_audio(speech_window)
-                cut_wav(speech_window, 3)
-                # play_audio(speech_window)
-
-                # RADAR PATCH
-                audio_array, sample_rate = sf.read(temp_file)
-                m2 = np.array([8, -16])
-                m3 = np.array([-8, -16])
-                location = complete_radar.radar(micro2=m2, micro3=m3, sound1=audio_array, sound2=audio_array, sound3=audio_array)
-                print("Location: ", location)
-
-
-                """  %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%  INSERTED CODE FINISH  %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%% """
-
-
-                # Read the transcription.
-                time_transcribe = time.perf_counter()
-                result = audio_model.transcribe(speech_window, fp16=torch.cuda.is_available())
-                print(f"Transcribed in {round(time.perf_counter() - time_transcribe, 2)} seconds")
-                text = result['text'].strip()
-
-                # If we detected a pause between recordings, add a new item to our transcription.
-                # Otherwise, edit the existing one.
-                if phrase_complete:
-                    transcription.append(text)
-                    print(text)
-                else:
-                    transcription[-1] = text
-
-                # # Clear the console to reprint the updated transcription.
-                # os.system('cls' if os.name == 'nt' else 'clear')
-                # for line in transcription:
-                #     print(line)
-                # print(f"[{round(time.perf_counter() - start, 2)} seconds behind]")
-                # # Flush stdout.
-                # print('', end='', flush=True)
-
-                # Infinite loops are bad for processors, must sleep.
-                sleep(0.25)
-        except KeyboardInterrupt:
-            break
+    # The stages block on their queues, so the main thread only waits for a keyboard interrupt or the replay to end.
+    try:
+        if args.replay:
+            source.finished.wait()
+            pipeline.stop()
+        else:
+            pipeline.wait()
+    except KeyboardInterrupt:
+        stop_listening(wait_for_stop=False)
+        pipeline.stop()
+    if visualizer is not None:
+        visualizer.stop()
 
     print("\n\nTranscription:")
-    for line in transcription:
+    for line in pipeline.transcription:
         print(line)
 
+    if not args.session:
+        print("\nTimings (seconds, rtf is a ratio):")
+        print(telemetry.report())
+    telemetry.close()
+
 
 
 
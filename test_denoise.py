@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+pytest.importorskip("librosa")
+pytest.importorskip("sounddevice")
+pytest.importorskip("soundfile")
+
+from denoise import BatchDenoiser
+
+WINDOW_LENGTH = 8
+OVERLAP = 2
+N_FEATURES = WINDOW_LENGTH // 2 + 1
+N_SEGMENTS = 8
+
+
+class LastSegment:
+    """Stand-in for the model, predicts the newest segment of every context window"""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_on_batch(self, batch):
+        self.batches.append(len(batch))
+        return batch[:, :, -1:, :]
+
+
+def make_file(rng, frames):
+    features = rng.normal(size=(frames, N_FEATURES, N_SEGMENTS, 1)).astype(np.float32)
+    phase = rng.uniform(-np.pi, np.pi, (N_FEATURES, frames))
+    return features, phase, np.zeros(frames), np.ones(frames)
+
+
+def test_every_file_is_finished_once():
+    rng = np.random.default_rng(0)
+    model = LastSegment()
+    denoiser = BatchDenoiser(model, batch_size=4, window_length=WINDOW_LENGTH, overlap=OVERLAP)
+
+    finished = []
+    for index, frames in enumerate([5, 0, 3, 2, 0]):
+        finished.extend(index for index, _ in denoiser.add(index, *make_file(rng, frames)))
+    finished.extend(index for index, _ in denoiser.flush())
+
+    # files too short for a context window are finished by their own add, the others once their last batch ran
+    assert finished == [1, 0, 2, 4, 3]
+    assert model.batches == [4, 4, 4]
@@ -1,33 +1,11 @@
 import tensorflow as tf
 import numpy as np
-from utils import play
+from utils import play, get_tf_record_dataset
 from data_processing.feature_extractor import FeatureExtractor
 
 train_tfrecords_filenames = './data_processing/test_0.tfrecords'
 
-def tf_record_parser(record):
-    keys_to_features = {
-        "noise_stft_phase": tf.io.FixedLenFeature((), tf.string, default_value=""),
-        'noise_stft_mag_features': tf.io.FixedLenFeature([], tf.string),
-        "clean_stft_magnitude": tf.io.FixedLenFeature((), tf.string)
-    }
-
-    features = tf.io.parse_single_example(record, keys_to_features)
-
-    noise_stft_mag_features = tf.io.decode_raw(features['noise_stft_mag_features'], tf.float32)
-    clean_stft_magnitude = tf.io.decode_raw(features['clean_stft_magnitude'], tf.float32)
-    noise_stft_phase = tf.io.decode_raw(features['noise_stft_phase'], tf.float32)
-
-    n_features = 129
-    # reshape input and annotation images
-    noise_stft_mag_features = tf.reshape(noise_stft_mag_features, (n_features, 8, 1), name="noise_stft_mag_features")
-    clean_stft_magnitude = tf.reshape(clean_stft_magnitude, (n_features, 1, 1), name="clean_stft_magnitude")
-    noise_stft_phase = tf.reshape(noise_stft_phase, (n_features,), name="noise_stft_phase")
-
-    return noise_stft_mag_features, clean_stft_magnitude, noise_stft_phase
-
-train_dataset = tf.data.TFRecordDataset([train_tfrecords_filenames])
-train_dataset = train_dataset.map(tf_record_parser)
+train_dataset = get_tf_record_dataset([train_tfrecords_filenames])
 train_dataset = train_dataset.repeat(1)
 train_dataset = train_dataset.batch(1000)
 train_dataset = train_dataset.prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
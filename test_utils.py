@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+pytest.importorskip("librosa")
+pytest.importorskip("sounddevice")
+
+from utils import (COMPRESSION_SUFFIXES, MAGNITUDE_ENCODINGS, PHASE_ENCODINGS, get_tf_feature,
+                   get_tf_record_dataset)
+
+N_FEATURES = 129
+N_SEGMENTS = 8
+
+# the largest error each encoding may add, uint8 magnitudes are companded so their error grows with the value
+MAGNITUDE_TOLERANCE = {'float32': 1e-6, 'float16': 1e-2, 'uint8': 1e-1}
+PHASE_TOLERANCE = {'float32': 1e-6, 'float16': 1e-2, 'uint8': 2 * np.pi / 256, 'uint16': 2 * np.pi / 65536}
+
+
+def make_example(rng):
+    noise = rng.normal(size=(N_FEATURES, N_SEGMENTS)).astype(np.float32)
+    clean = rng.normal(size=(N_FEATURES, 1)).astype(np.float32)
+    phase = rng.uniform(-np.pi, np.pi, N_FEATURES).astype(np.float32)
+    return noise, clean, phase
+
+
+def write_records(path, examples, compression=None, magnitude_encoding='float32', phase_encoding='float32'):
+    with tf.io.TFRecordWriter(str(path), options=compression or '') as writer:
+        for noise, clean, phase in examples:
+            writer.write(get_tf_feature(noise, clean, phase, magnitude_encoding, phase_encoding).SerializeToString())
+
+
+def phase_error(a, b):
+    return np.abs(np.angle(np.exp(1j * (a - b))))
+
+
+@pytest.mark.parametrize("compression", [None, *COMPRESSION_SUFFIXES])
+@pytest.mark.parametrize("magnitude_encoding", MAGNITUDE_ENCODINGS)
+@pytest.mark.parametrize("phase_encoding", PHASE_ENCODINGS)
+def test_round_trip(tmp_path, compression, magnitude_encoding, phase_encoding):
+    rng = np.random.default_rng(0)
+    examples = [make_example(rng) for _ in range(3)]
+    path = tmp_path / ('examples.tfrecords' + COMPRESSION_SUFFIXES.get(compression, ''))
+    write_records(path, examples, compression, magnitude_encoding, phase_encoding)
+
+    parsed = list(get_tf_record_dataset([str(path)]))
+    assert len(parsed) == len(examples)
+    for (noise, clean, phase), (noise_read, clean_read, phase_read) in zip(examples, parsed):
+        assert noise_read.shape == (N_FEATURES, N_SEGMENTS, 1)
+        assert clean_read.shape == (N_FEATURES, 1, 1)
+        assert phase_read.shape == (N_FEATURES,)
+        np.testing.assert_allclose(noise_read.numpy()[..., 0], noise, atol=MAGNITUDE_TOLERANCE[magnitude_encoding])
+        np.testing.assert_allclose(clean_read.numpy()[..., 0], clean, atol=MAGNITUDE_TOLERANCE[magnitude_encoding])
+        assert phase_error(phase_read.numpy(), phase).max() <= PHASE_TOLERANCE[phase_encoding] + 1e-6
+
+
+def test_mixed_compression_keeps_order(tmp_path):
+    rng = np.random.default_rng(1)
+    filenames, expected = [], []
+    for index, compression in enumerate([None, 'GZIP', None, 'ZLIB', 'GZIP']):
+        examples = [make_example(rng) for _ in range(2)]
+        path = tmp_path / (f'part_{index}.tfrecords' + COMPRESSION_SUFFIXES.get(compression, ''))
+        write_records(path, examples, compression)
+        filenames.append(str(path))
+        expected.extend(examples)
+
+    parsed = list(get_tf_record_dataset(filenames))
+    assert len(parsed) == len(expected)
+    for (_, clean, _), (_, clean_read, _) in zip(expected, parsed):
+        np.testing.assert_allclose(clean_read.numpy()[..., 0], clean)
+
+
+def test_no_files():
+    with pytest.raises(ValueError):
+        get_tf_record_dataset([])
@@ -91,13 +91,185 @@ def _int64_feature(value):
     return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
 
 
-def get_tf_feature(noise_stft_mag_features, clean_stft_magnitude, noise_stft_phase):
-    noise_stft_mag_features = noise_stft_mag_features.astype(np.float32).tostring()
-    clean_stft_magnitude = clean_stft_magnitude.astype(np.float32).tostring()
-    noise_stft_phase = noise_stft_phase.astype(np.float32).tostring()
+# encodings are stored in each example by their index in these tuples, so only append to them
+MAGNITUDE_ENCODINGS = ('float32', 'float16', 'uint8')
+PHASE_ENCODINGS = ('float32', 'float16', 'uint8', 'uint16')
+COMPRESSION_SUFFIXES = {'GZIP': '.gz', 'ZLIB': '.zlib'}
+
+
+def encode_magnitude(magnitude, encoding='float32'):
+    """Serializes a (standardized) magnitude array
+    input:
+        magnitude (np.array): the magnitude features
+        encoding (str): one of MAGNITUDE_ENCODINGS
+    output:
+        data (bytes): the serialized array
+        offset (float): the dequantization offset
+        scale (float): the dequantization scale"""
+    if encoding == 'float32':
+        return magnitude.astype(np.float32).tobytes(), 0.0, 1.0
+    if encoding == 'float16':
+        return magnitude.astype(np.float16).tobytes(), 0.0, 1.0
+    if encoding == 'uint8':
+        # the features are standardized, so compand the magnitude with a signed log before quantizing
+        companded = np.sign(magnitude) * np.log1p(np.abs(magnitude))
+        offset = float(np.min(companded))
+        scale = float(np.max(companded) - offset) / 255 or 1.0
+        codes = np.round((companded - offset) / scale).astype(np.uint8)
+        return codes.tobytes(), offset, scale
+    raise ValueError(f"Unknown magnitude encoding: {encoding}")
+
+
+def decode_magnitude(data, encoding='float32', offset=0.0, scale=1.0):
+    """Inverse of encode_magnitude, returns a flat float32 array"""
+    if encoding == 'float32':
+        return np.frombuffer(data, dtype=np.float32)
+    if encoding == 'float16':
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+    if encoding == 'uint8':
+        companded = np.frombuffer(data, dtype=np.uint8).astype(np.float32) * scale + offset
+        return np.sign(companded) * np.expm1(np.abs(companded))
+    raise ValueError(f"Unknown magnitude encoding: {encoding}")
+
+
+def encode_phase(phase, encoding='float32'):
+    """Serializes a phase array in radians, integer encodings cover [-pi, pi) uniformly"""
+    if encoding == 'float32':
+        return phase.astype(np.float32).tobytes()
+    if encoding == 'float16':
+        return phase.astype(np.float16).tobytes()
+    if encoding in ('uint8', 'uint16'):
+        levels = np.iinfo(encoding).max + 1
+        codes = np.round((phase + np.pi) * levels / (2 * np.pi)).astype(np.int64) % levels
+        return codes.astype(encoding).tobytes()
+    raise ValueError(f"Unknown phase encoding: {encoding}")
+
+
+def decode_phase(data, encoding='float32'):
+    """Inverse of encode_phase, returns a flat float32 array"""
+    if encoding in ('float32', 'float16'):
+        return np.frombuffer(data, dtype=encoding).astype(np.float32)
+    if encoding in ('uint8', 'uint16'):
+        levels = np.iinfo(encoding).max + 1
+        codes = np.frombuffer(data, dtype=encoding).astype(np.float32)
+        return codes * np.float32(2 * np.pi / levels) - np.float32(np.pi)
+    raise ValueError(f"Unknown phase encoding: {encoding}")
+
+
+def get_tf_feature(noise_stft_mag_features, clean_stft_magnitude, noise_stft_phase, magnitude_encoding='float32',
+                   phase_encoding='float32'):
+    noise_stft_mag_features, noise_offset, noise_scale = encode_magnitude(noise_stft_mag_features,
+                                                                          magnitude_encoding)
+    clean_stft_magnitude, clean_offset, clean_scale = encode_magnitude(clean_stft_magnitude, magnitude_encoding)
+    noise_stft_phase = encode_phase(noise_stft_phase, phase_encoding)
 
     example = tf.train.Example(features=tf.train.Features(feature={
         'noise_stft_phase': _bytes_feature(noise_stft_phase),
         'noise_stft_mag_features': _bytes_feature(noise_stft_mag_features),
-        'clean_stft_magnitude': _bytes_feature(clean_stft_magnitude)}))
+        'clean_stft_magnitude': _bytes_feature(clean_stft_magnitude),
+        'magnitude_encoding': _int64_feature(MAGNITUDE_ENCODINGS.index(magnitude_encoding)),
+        'phase_encoding': _int64_feature(PHASE_ENCODINGS.index(phase_encoding)),
+        'noise_magnitude_offset': _float_feature(noise_offset),
+        'noise_magnitude_scale': _float_feature(noise_scale),
+        'clean_magnitude_offset': _float_feature(clean_offset),
+        'clean_magnitude_scale': _float_feature(clean_scale)}))
     return example
+
+
+def _tf_decode_magnitude(data, encoding, offset, scale):
+    def _float32():
+        return tf.io.decode_raw(data, tf.float32)
+
+    def _float16():
+        return tf.cast(tf.io.decode_raw(data, tf.float16), tf.float32)
+
+    def _uint8():
+        companded = tf.cast(tf.io.decode_raw(data, tf.uint8), tf.float32) * scale + offset
+        return tf.sign(companded) * tf.math.expm1(tf.abs(companded))
+
+    return tf.switch_case(tf.cast(encoding, tf.int32), branch_fns=[_float32, _float16, _uint8])
+
+
+def _tf_decode_phase(data, encoding):
+    def _float32():
+        return tf.io.decode_raw(data, tf.float32)
+
+    def _float16():
+        return tf.cast(tf.io.decode_raw(data, tf.float16), tf.float32)
+
+    def _uint8():
+        return tf.cast(tf.io.decode_raw(data, tf.uint8), tf.float32) * (2 * np.pi / 256) - np.pi
+
+    def _uint16():
+        return tf.cast(tf.io.decode_raw(data, tf.uint16), tf.float32) * (2 * np.pi / 65536) - np.pi
+
+    return tf.switch_case(tf.cast(encoding, tf.int32), branch_fns=[_float32, _float16, _uint8, _uint16])
+
+
+def tf_record_parser(record, n_features=129, n_segments=8):
+    """Parses one example written by get_tf_feature, decoding any of the magnitude and phase encodings.
+    Records written before the encodings existed have no encoding fields and default to float32."""
+    keys_to_features = {
+        "noise_stft_phase": tf.io.FixedLenFeature((), tf.string, default_value=""),
+        'noise_stft_mag_features': tf.io.FixedLenFeature([], tf.string),
+        "clean_stft_magnitude": tf.io.FixedLenFeature((), tf.string),
+        'magnitude_encoding': tf.io.FixedLenFeature((), tf.int64, default_value=0),
+        'phase_encoding': tf.io.FixedLenFeature((), tf.int64, default_value=0),
+        'noise_magnitude_offset': tf.io.FixedLenFeature((), tf.float32, default_value=0.0),
+        'noise_magnitude_scale': tf.io.FixedLenFeature((), tf.float32, default_value=1.0),
+        'clean_magnitude_offset': tf.io.FixedLenFeature((), tf.float32, default_value=0.0),
+        'clean_magnitude_scale': tf.io.FixedLenFeature((), tf.float32, default_value=1.0),
+    }
+
+    features = tf.io.parse_single_example(record, keys_to_features)
+
+    noise_stft_mag_features = _tf_decode_magnitude(features['noise_stft_mag_features'],
+                                                   features['magnitude_encoding'],
+                                                   features['noise_magnitude_offset'],
+                                                   features['noise_magnitude_scale'])
+    clean_stft_magnitude = _tf_decode_magnitude(features['clean_stft_magnitude'], features['magnitude_encoding'],
+                                                features['clean_magnitude_offset'],
+                                                features['clean_magnitude_scale'])
+    noise_stft_phase = _tf_decode_phase(features['noise_stft_phase'], features['phase_encoding'])
+
+    # reshape input and annotation images
+    noise_stft_mag_features = tf.reshape(noise_stft_mag_features, (n_features, n_segments, 1),
+                                         name="noise_stft_mag_features")
+    clean_stft_magnitude = tf.reshape(clean_stft_magnitude, (n_features, 1, 1), name="clean_stft_magnitude")
+    noise_stft_phase = tf.reshape(noise_stft_phase, (n_features,), name="noise_stft_phase")
+
+    return noise_stft_mag_features, clean_stft_magnitude, noise_stft_phase
+
+
+def get_tf_record_filename(prefix, counter, compression=None):
+    """The record path for a subset, compressed records get a suffix so readers can tell them apart"""
+    return './records/' + prefix + '_' + str(counter) + '.tfrecords' + COMPRESSION_SUFFIXES.get(compression, '')
+
+
+def get_compression_type(filename):
+    """Infers the TFRecord compression type from a filename written by get_tf_record_filename"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if filename.endswith(suffix):
+            return compression
+    return ''
+
+
+def get_tf_record_dataset(filenames):
+    """Reads and parses record files in the given order, which may mix compression types and encodings"""
+    filenames = list(filenames)
+    if not filenames:
+        raise ValueError("No record files to read")
+
+    # one reader per run of consecutive files with the same compression, so the order of the examples is kept
+    datasets = []
+    start = 0
+    for end in range(1, len(filenames) + 1):
+        compression = get_compression_type(filenames[start])
+        if end == len(filenames) or get_compression_type(filenames[end]) != compression:
+            datasets.append(tf.data.TFRecordDataset(filenames[start:end], compression_type=compression))
+            start = end
+
+    dataset = datasets[0]
+    for other in datasets[1:]:
+        dataset = dataset.concatenate(other)
+    return dataset.map(tf_record_parser, num_parallel_calls=tf.data.experimental.AUTOTUNE)